@@ -6,22 +6,48 @@ Fields the nurse types:
   - Personnummer: 11 digits (e.g., 01019912345)
   - Dato: YYYY-MM-DD (e.g., 2025-09-02)
   - Klokke: HH:MM 24h (e.g., 14:37)
+
+Usage:
+  python3 barCodeGenSh.py                        # register samples interactively
+  python3 barCodeGenSh.py --batch 20             # ... inserting 20 at a time (and on exit)
+  python3 barCodeGenSh.py --import samples.csv   # load an existing samples.csv
+
+The database runs in WAL mode: readers (lookups) never block the writer. With
+synchronous=NORMAL a commit needs no fsync (only checkpoints do); a power cut can
+lose the last commits but never corrupts the file. Use --sync full to fsync every
+commit. Batches and imports go in with executemany, one transaction per batch
+(an import is a single transaction: all rows or none).
 """
 
+import argparse
+import csv
 import re
 import uuid
 import sqlite3
-from datetime import datetime
+from datetime import date, datetime, time
+from itertools import islice
 from pathlib import Path
 
 DB_PATH = Path("lab.db")
+CSV_PATH = Path(__file__).with_name("samples.csv")
 
 PERSONNR_RE = re.compile(r"^\d{11}$")
 DATE_FMT = "%Y-%m-%d"
 TIME_FMT = "%H:%M"
 
-def ensure_db(path: Path = DB_PATH):
-    con = sqlite3.connect(path)
+SYNC_MODES = ("off", "normal", "full")
+BUSY_TIMEOUT_S = 5.0   # wait this long for another writer instead of failing
+IMPORT_CHUNK = 5000    # rows per executemany during --import
+
+INSERT_SQL = "INSERT INTO samples(labnummer, personnummer, collected_at, created_at) VALUES(?,?,?,?)"
+IMPORT_SQL = "INSERT OR IGNORE INTO samples(labnummer, personnummer, collected_at, created_at) VALUES(?,?,?,?)"
+
+def ensure_db(path: Path = DB_PATH, synchronous: str = "normal"):
+    if synchronous not in SYNC_MODES:
+        raise ValueError(f"synchronous must be one of {SYNC_MODES}")
+    con = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S)
+    con.execute("PRAGMA journal_mode=WAL")  # persistent: stored in the database file
+    con.execute(f"PRAGMA synchronous={synchronous}")
     cur = con.cursor()
     cur.execute("""
         CREATE TABLE IF NOT EXISTS samples (
@@ -64,17 +90,96 @@ def gen_labnummer() -> str:
     return f"LAB-{datetime.now():%Y%m%d}-{uuid.uuid4().hex[:10].upper()}"
 
 def save_sample(con, labnummer: str, personnummer: str, collected_iso_min: str):
-    cur = con.cursor()
-    cur.execute(
-        "INSERT INTO samples(labnummer, personnummer, collected_at, created_at) VALUES(?,?,?,?)",
-        (labnummer, personnummer, collected_iso_min, datetime.now().isoformat(timespec="seconds"))
-    )
-    con.commit()
-
-def main():
-    print("=== Registrer blodprøve (PoC) ===\n")
-    con = ensure_db()
+    with con:
+        con.execute(INSERT_SQL, (labnummer, personnummer, collected_iso_min, datetime.now().isoformat(timespec="seconds")))
+
+class BatchWriter:
+    """Collects registrations and inserts them `batch_size` at a time (executemany, one commit)."""
+
+    def __init__(self, con, batch_size: int = 1):
+        self.con = con
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        self.failed = []  # rows of batches whose insert raised; set aside, never retried
+
+    def add(self, labnummer: str, personnummer: str, collected_iso_min: str) -> bool:
+        """Queue one sample -> True if it is stored now, False if it waits for the batch."""
+        self.pending.append((labnummer, personnummer, collected_iso_min, datetime.now().isoformat(timespec="seconds")))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self) -> int:
+        """Insert the queued rows -> how many. If the insert raises, they move to `failed` first."""
+        batch, self.pending = self.pending, []
+        if batch:
+            try:
+                with self.con:
+                    self.con.executemany(INSERT_SQL, batch)
+            except Exception:
+                self.failed.extend(batch)
+                raise
+        return len(batch)
+
+    def report_failed(self) -> None:
+        if self.failed:
+            print(f"⚠️  Ikke lagret: {', '.join(row[0] for row in self.failed)}")
+            self.failed.clear()
+
+# ---- --import ----
+def collected_iso(d: str, t: str):
+    """YYYY-MM-DD + HH:MM -> YYYY-MM-DDTHH:MM, or None if either is not a valid date / time."""
+    # fromisoformat also takes other ISO forms (2025-W01-1, 1000 for 10:00): pin the shape first
+    if (len(d) != 10 or d[4] != "-" or d[7] != "-" or len(t) != 5 or t[2] != ":"
+            or not (d + t).isascii() or not (d[:4] + d[5:7] + d[8:] + t[:2] + t[3:]).isdigit()):
+        return None
+    try:
+        date.fromisoformat(d)  # much faster than strptime; checks the month/day/hour/minute ranges
+        time.fromisoformat(t)
+    except ValueError:
+        return None
+    return f"{d}T{t}"
+
+def csv_samples(csv_path: Path, stats: dict):
+    """Rows to insert from a samples.csv (dato/klokke or date/time columns); bad rows are counted, not yielded."""
+    with Path(csv_path).open("r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader, [])]
+        header = [{"dato": "date", "klokke": "time"}.get(h, h) for h in header]
+        cols = [header.index(c) if c in header else None for c in ("labnummer", "personnummer", "date", "time", "created_at")]
+        width = len(header)
+        for rec in reader:
+            if not rec:
+                continue
+            stats["read"] += 1
+            rec += [""] * (width - len(rec))
+            lab, pn, d, t, created = (rec[i].strip() if i is not None else "" for i in cols)
+            collected = collected_iso(d, t)
+            if not lab or not PERSONNR_RE.match(pn) or collected is None:
+                stats["invalid"] += 1
+                continue
+            yield lab, pn, collected, created or datetime.now().isoformat(timespec="seconds")
+
+def import_csv(con, csv_path: Path = CSV_PATH, chunk: int = IMPORT_CHUNK) -> dict:
+    """
+    Load samples.csv in one transaction. Labnumre already in the database are
+    left alone, so importing the same file again adds nothing.
+    """
+    stats = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0}
+    rows = csv_samples(csv_path, stats)
+    with con:
+        before = con.total_changes
+        while True:
+            batch = list(islice(rows, chunk))
+            if not batch:
+                break
+            con.executemany(IMPORT_SQL, batch)
+        stats["inserted"] = con.total_changes - before
+    stats["duplicates"] = stats["read"] - stats["invalid"] - stats["inserted"]
+    return stats
 
+def register_loop(writer: BatchWriter):
     while True:
         try:
             pn = prompt_personnummer()
@@ -86,9 +191,12 @@ def main():
             collected_iso_min = collected.isoformat(timespec="minutes")
 
             labnr = gen_labnummer()
-            save_sample(con, labnr, pn, collected_iso_min)
+            stored = writer.add(labnr, pn, collected_iso_min)
 
-            print("\n✅ Lagret")
+            if stored:
+                print("\n✅ Lagret")
+            else:
+                print(f"\n✅ Registrert ({len(writer.pending)} venter, lagres samlet)")
             print(f"  Personnummer : {pn}")
             print(f"  Dato         : {d.isoformat()}")
             print(f"  Klokke       : {t}")
@@ -99,11 +207,42 @@ def main():
                 print("Ferdig.")
                 break
 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):  # Ctrl-C, or end of piped input
             print("\nAvslutter.")
             break
         except Exception as e:
-            print(f"⚠️  Feil: {e}\n")
+            print(f"⚠️  Feil: {e}")
+            writer.report_failed()
+            print()
+
+def main():
+    ap = argparse.ArgumentParser(description="Register blood samples in the SQLite registry.")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--sync", choices=SYNC_MODES, default="normal", help="PRAGMA synchronous (default normal)")
+    ap.add_argument("--batch", type=int, default=1, help="registrations per insert (default 1 = each at once)")
+    ap.add_argument("--import", dest="import_csv", type=Path, nargs="?", const=CSV_PATH, metavar="CSV",
+                    help=f"load a samples.csv (default {CSV_PATH.name} next to this script) and exit")
+    args = ap.parse_args()
+
+    con = ensure_db(args.db, args.sync)
+    if args.import_csv:
+        stats = import_csv(con, args.import_csv)
+        print(f"✅ Importert {stats['inserted']} prøver fra {args.import_csv} "
+              f"({stats['duplicates']} fantes fra før, {stats['invalid']} ugyldige rader hoppet over)")
+        con.close()
+        return
+
+    print("=== Registrer blodprøve (PoC) ===\n")
+    writer = BatchWriter(con, args.batch)
+    try:
+        register_loop(writer)
+    finally:
+        try:
+            if writer.flush():  # whatever is still queued (quit, Ctrl-C, error)
+                print("✅ Ventende prøver lagret.")
+        finally:
+            writer.report_failed()
+            con.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+# backEnd/DigLabAPI/PythonService/analysis_pool.py
+"""
+Bounded process pool for CPU-heavy work (PDF rendering + NumPy scoring).
+
+Work is admitted while `in_flight < workers + max_queue`; beyond that `submit`
+raises PoolSaturated so the route can answer 503 + Retry-After instead of
+letting requests pile up behind the event loop.
+
+Workers are spawned on first use, or all at once by start(); with `warm` steps
+each one runs warmup.warm_worker before taking tasks (see warmup.py).
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from metrics import collect, observe_stages
+from warmup import warm_worker
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class AnalysisPool:
+    def __init__(self, workers: int, max_queue: int, retry_after: int = 2, warm: tuple[str, ...] = ()):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self.warm = warm
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so importing main.py (uvicorn --reload, tests) doesn't spawn processes
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                initializer=warm_worker if self.warm else None, initargs=(self.warm,) if self.warm else (),
+            )
+        return self._executor
+
+    def start(self) -> None:
+        """Spawn (and warm) every worker now instead of on the first requests."""
+        with self._lock:
+            executor = self._get_executor()
+        # One no-op per worker: each submit without an idle worker spawns a new one
+        wait([executor.submit(int) for _ in range(self.workers)])
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated()
+            self._in_flight += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    async def submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        self._acquire()
+        try:
+            with self._lock:
+                executor = self._get_executor()
+            # Stage timings recorded in the worker come back with the result (see metrics.py)
+            future = executor.submit(collect, fn, *args)
+        except BaseException as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool):
+                self._reset(executor)
+            raise
+        # The slot is held until the job ends, even if the request stops waiting for it
+        # (client gone, timeout): a cancelled job that already runs keeps its worker busy
+        future.add_done_callback(lambda _: self._release())
+        try:
+            result, timings = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise
+        observe_stages(timings)
+        return result
+
+    def _reset(self, executor: ProcessPoolExecutor) -> None:
+        # A worker died (e.g. OOM on a huge page); start fresh on the next call
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    async def submit_when_ready(self, fn: Callable[..., Any], *args: Any, poll: float = 0.05) -> Any:
+        """Like submit(), but waits for a free slot instead of raising PoolSaturated (batch jobs)."""
+        while True:
+            try:
+                return await self.submit(fn, *args)
+            except PoolSaturated:
+                with self._lock:
+                    self._rejected -= 1  # not a rejection, just back-pressure
+                await asyncio.sleep(poll)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = min(self._in_flight, self.workers)
+            return {
+                "workers": self.workers,
+                "running": running,
+                "queued": self._in_flight - running,
+                "max_queue": self.max_queue,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                # Wait for the running jobs: a uvicorn --workers child exits via os._exit, which
+                # would otherwise orphan the pool processes before they are told to stop
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
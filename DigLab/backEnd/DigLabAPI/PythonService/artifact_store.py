@@ -0,0 +1,272 @@
+# backEnd/DigLabAPI/PythonService/artifact_store.py
+"""
+Sharded, deduplicated storage for the service's artifacts (scans/, forms/,
+formResults/, barcodes/), replacing one flat directory per kind.
+
+- Files are named as before (LAB-20250301-56677E98.pdf, DigLab-<lab>-results.pdf, ...)
+  but live under a date shard taken from the labnummer in the name:
+  <root>/2025/03/<name>; names without one go to <root>/misc/<name>.
+- Content is stored once: each named file is a hard link to <root>/.blobs/<sha256>,
+  so identical uploads / re-rendered forms cost one copy. Writes are atomic
+  (temp file + rename); nothing is modified in place.
+- Maintenance (ArtifactStore.maintain, run periodically by main.py):
+    * files still in the old flat layout are moved into their shard,
+    * files not written for `compress_after_days` are gzipped to <name>.gz
+      (formats that are already compressed are left alone),
+    * files older than `retention_days` are deleted (0 = keep forever),
+    * unreferenced blobs and empty shard directories are removed.
+- Readers go through locate(): it finds the shard, a legacy flat file, or
+  transparently restores a .gz, and returns a plain path.
+- Safe for several processes / hosts on one (shared) root: linking, restoring and
+  collecting take <root>/.lock (see file_lock.py), and only one process at a time
+  runs maintenance (<root>/.maintain.lock; the others skip the pass).
+
+Run maintenance by hand (e.g. from cron) with:
+  python3 artifact_store.py --maintain [--retention-days N] [--compress-after-days N] DIR...
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, Optional
+
+from file_lock import LOCK_SUFFIX, FileLock
+
+DATE_RE = re.compile(r"LAB-(\d{4})(\d{2})\d{2}-", re.I)
+BLOBS = ".blobs"
+UNDATED = "misc"
+GZ = ".gz"
+PRECOMPRESSED = (".png", ".jpg", ".jpeg")  # gzip saves next to nothing on these
+BLOB_GRACE_S = 3600  # never collect a blob younger than this (a writer may be about to link it)
+
+DAY = 86400.0
+
+
+class ArtifactStore:
+    """One artifact kind (e.g. scans) under `root`."""
+
+    def __init__(self, root: Path, *, retention_days: float = 0, compress_after_days: float = 0):
+        self.root = Path(root)
+        self.retention_days = retention_days
+        self.compress_after_days = compress_after_days
+        self._lock = FileLock(self.root / LOCK_SUFFIX)  # directories are created by the first write
+        self._maintain_lock = FileLock(self.root / f".maintain{LOCK_SUFFIX}")
+
+    # ------------------------------------------------------------------ names
+    def path(self, name: str) -> Path:
+        """Where `name` is stored (whether or not it exists yet)."""
+        m = DATE_RE.search(name)
+        shard = Path(m.group(1), m.group(2)) if m else Path(UNDATED)
+        return self.root / shard / name
+
+    def exists(self, name: str) -> bool:
+        p = self.path(name)
+        return p.exists() or p.with_name(name + GZ).exists() or (self.root / name).is_file()
+
+    def locate(self, name: str) -> Optional[Path]:
+        """Readable path of `name` (restoring it if it was compressed), or None."""
+        p = self.path(name)
+        if p.exists():
+            return p
+        legacy = self.root / name
+        if legacy.is_file():
+            return legacy
+        gz = p.with_name(name + GZ)
+        if gz.exists():
+            with self._lock:
+                if not p.exists():
+                    try:
+                        with gzip.open(gz, "rb") as f:
+                            self.put(name, f.read())
+                    except FileNotFoundError:  # compressed + pruned concurrently
+                        return None
+                    gz.unlink(missing_ok=True)
+            return p
+        return None
+
+    def read(self, name: str) -> Optional[bytes]:
+        p = self.locate(name)
+        return p.read_bytes() if p else None
+
+    # ------------------------------------------------------------------ writes
+    def temp_path(self, suffix: str = ".tmp") -> Path:
+        """Scratch file on the store's filesystem (for put_file)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f".{uuid.uuid4().hex}{suffix}"
+
+    def put(self, name: str, data: bytes) -> Path:
+        """Store `data` as `name` atomically; identical content shares one blob."""
+        tmp = self.temp_path()
+        try:
+            tmp.write_bytes(data)
+            return self._commit(name, tmp, hashlib.sha256(data).hexdigest())
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def put_file(self, name: str, src: Path) -> Path:
+        """Move a finished file (ideally from temp_path()) into the store as `name`."""
+        h = hashlib.sha256()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        try:
+            return self._commit(name, Path(src), h.hexdigest())
+        finally:
+            Path(src).unlink(missing_ok=True)
+
+    def _commit(self, name: str, tmp: Path, digest: str) -> Path:
+        dest = self.path(name)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        blob = self.root / BLOBS / digest[:2] / digest
+        link = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.lnk")
+        with self._lock:
+            try:
+                if blob.exists():
+                    os.utime(blob)  # written again: counts as new for retention
+                else:
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp, blob)
+                os.link(blob, link)
+            except OSError:
+                # No hard links here (or the blob vanished): store a plain copy
+                link.unlink(missing_ok=True)
+                if tmp.exists():
+                    os.replace(tmp, link)
+                else:
+                    shutil.copyfile(blob, link)
+            os.replace(link, dest)
+            link.unlink(missing_ok=True)  # dest was already this blob: rename() was a no-op
+            dest.with_name(name + GZ).unlink(missing_ok=True)
+            legacy = self.root / name
+            if legacy != dest:
+                legacy.unlink(missing_ok=True)
+        return dest
+
+    def delete(self, name: str) -> None:
+        p = self.path(name)
+        for f in (p, p.with_name(name + GZ), self.root / name):
+            f.unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------ maintenance
+    def _shard_files(self, scratch: bool = False) -> Iterable[Path]:
+        """Stored files, or with `scratch` the temp/link files writers leave next to them."""
+        if not self.root.is_dir():
+            return
+        for d in self.root.iterdir():
+            if d.is_dir() and d.name != BLOBS:
+                for f in d.rglob("*"):
+                    if f.is_file() and f.name.startswith(".") == scratch:
+                        yield f
+
+    def maintain(self, now: Optional[float] = None) -> dict:
+        """Migrate flat files, compress cold ones, prune expired ones, collect blobs."""
+        now = time.time() if now is None else now
+        report = {"migrated": 0, "compressed": 0, "pruned": 0, "blobsRemoved": 0, "bytesFreed": 0}
+        if not self.root.is_dir():  # nothing written yet
+            return {**report, **self.stats()}
+        if not self._maintain_lock.acquire(blocking=False):
+            return {**report, "skipped": "maintained by another process", **self.stats()}
+        try:
+            self._maintain(now, report)
+        finally:
+            self._maintain_lock.release()
+        report.update(self.stats())
+        return report
+
+    def _maintain(self, now: float, report: dict) -> None:
+        for f in list(self.root.iterdir()):
+            if f.is_file() and not f.name.startswith("."):
+                self.put_file(f.name, f)
+                report["migrated"] += 1
+        for f in [*self.root.glob(".*"), *self._shard_files(scratch=True)]:
+            try:
+                if f.is_file() and not f.name.endswith(LOCK_SUFFIX) and now - f.stat().st_mtime > BLOB_GRACE_S:
+                    f.unlink()  # left behind by a crashed writer
+            except FileNotFoundError:
+                pass
+
+        expire = self.retention_days * DAY if self.retention_days > 0 else None
+        cold = self.compress_after_days * DAY if self.compress_after_days > 0 else None
+        for f in list(self._shard_files()):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            age = now - st.st_mtime
+            if expire is not None and age > expire:
+                f.unlink(missing_ok=True)
+                report["pruned"] += 1
+                if st.st_nlink == 1:
+                    report["bytesFreed"] += st.st_size
+            elif (cold is not None and age > cold and f.suffix != GZ
+                  and f.suffix.lower() not in PRECOMPRESSED):
+                self._compress(f, st.st_mtime)
+                report["compressed"] += 1
+
+        for blob in list((self.root / BLOBS).glob("*/*")):
+            st = blob.stat()
+            if st.st_nlink == 1 and now - st.st_mtime > BLOB_GRACE_S:
+                with self._lock:
+                    if blob.stat().st_nlink == 1:
+                        blob.unlink()
+                        report["blobsRemoved"] += 1
+                        report["bytesFreed"] += st.st_size
+
+        for d in sorted((p for p in self.root.rglob("*") if p.is_dir()), key=lambda p: len(p.parts), reverse=True):
+            try:
+                d.rmdir()  # only succeeds when empty
+            except OSError:
+                pass
+
+    def _compress(self, f: Path, mtime: float) -> None:
+        gz = f.with_name(f.name + GZ)
+        tmp = f.with_name(f".{f.name}.{uuid.uuid4().hex[:8]}{GZ}")
+        with self._lock:
+            try:
+                with open(f, "rb") as src, gzip.open(tmp, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.utime(tmp, (mtime, mtime))  # keep the age for retention
+                os.replace(tmp, gz)
+                f.unlink()
+            except FileNotFoundError:
+                tmp.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        """File count + bytes on disk (deduplicated). Walks the tree: maintenance only, not per request."""
+        files = compressed = size = 0
+        seen: set[int] = set()
+        for f in self._shard_files():
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            files += 1
+            compressed += f.suffix == GZ
+            if st.st_ino not in seen:
+                seen.add(st.st_ino)
+                size += st.st_size
+        return {"files": files, "compressed": compressed, "bytes": size}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Migrate / compress / prune artifact directories")
+    ap.add_argument("dirs", nargs="+", type=Path)
+    ap.add_argument("--maintain", action="store_true", required=True)
+    ap.add_argument("--retention-days", type=float, default=0)
+    ap.add_argument("--compress-after-days", type=float, default=0)
+    args = ap.parse_args()
+    for d in args.dirs:
+        store = ArtifactStore(d, retention_days=args.retention_days, compress_after_days=args.compress_after_days)
+        print(d, json.dumps(store.maintain()))
+
+
+if __name__ == "__main__":
+    main()
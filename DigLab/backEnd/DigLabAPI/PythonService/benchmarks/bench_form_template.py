@@ -0,0 +1,90 @@
+# backEnd/DigLabAPI/PythonService/benchmarks/bench_form_template.py
+"""
+Cached-template forms (form_template.render_lab_form_pdf) vs the full ReportLab build
+(pdf_form.generate_lab_form_pdf): time per form, and a check that both are the same form
+(rendered pixels, extracted text, layout descriptor).
+
+  python3 benchmarks/bench_form_template.py [-n 200]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz  # PyMuPDF
+import numpy as np
+import qrcode
+
+from form_layout import read_layout
+from form_template import render_lab_form_pdf
+from pdf_form import ALL_DIAGNOSES, generate_lab_form_pdf
+
+CASES = [
+    dict(name="Ola Nordmann", personnummer="01010112345", diagnoses=["Dengue", "TBE"]),
+    dict(name="Kari Østby-Åsen (test)", personnummer=None, diagnoses=ALL_DIAGNOSES),
+    dict(name="Per \\ Paal", personnummer="31129954321", diagnoses=[]),
+]
+
+
+def page_pixels(path: Path, dpi: int = 100) -> np.ndarray:
+    with fitz.open(path) as doc:
+        pix = doc[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def page_text(path: Path) -> str:
+    with fitz.open(path) as doc:
+        return doc[0].get_text("text")
+
+
+def page_layout(path: Path) -> dict:
+    with fitz.open(path) as doc:
+        return read_layout(doc)
+
+
+def timed(fn, n: int, tmp: Path, qr_png: Path, tag: str) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        case = CASES[i % len(CASES)]
+        fn(tmp / f"{tag}-{i % 8}.pdf", labnummer=f"LAB-20250301-{i:08d}", date="2025-03-01", time="10:00",
+           qr_png=qr_png, **case)
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=200, help="forms per variant")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        qr_png = tmp / "qr.png"
+        qrcode.make("LAB-20250301-00000000;DX=5").save(qr_png)
+
+        # Same form?
+        for i, case in enumerate(CASES):
+            kw = dict(labnummer="LAB-20250301-00000000", date="2025-03-01", time="10:00", qr_png=qr_png, **case)
+            ref, tpl = tmp / f"ref{i}.pdf", tmp / f"tpl{i}.pdf"
+            generate_lab_form_pdf(ref, **kw)
+            render_lab_form_pdf(tpl, **kw)
+            diff = np.abs(page_pixels(ref).astype(int) - page_pixels(tpl).astype(int))
+            print(f"case {i}: max pixel diff {diff.max()}, "
+                  f"text {'same' if page_text(ref) == page_text(tpl) else 'DIFFERENT'}, "
+                  f"layout {'same' if page_layout(ref) == page_layout(tpl) else 'DIFFERENT'}")
+
+        # Warm both paths (fonts, template cache) before timing
+        timed(generate_lab_form_pdf, 3, tmp, qr_png, "ref")
+        timed(render_lab_form_pdf, 3, tmp, qr_png, "tpl")
+        ref_ms = timed(generate_lab_form_pdf, args.n, tmp, qr_png, "ref")
+        tpl_ms = timed(render_lab_form_pdf, args.n, tmp, qr_png, "tpl")
+        print(f"generate_lab_form_pdf: {ref_ms:.2f} ms/form")
+        print(f"render_lab_form_pdf:   {tpl_ms:.2f} ms/form  ({ref_ms / tpl_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
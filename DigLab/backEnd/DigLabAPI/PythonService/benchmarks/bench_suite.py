@@ -0,0 +1,331 @@
+# backEnd/DigLabAPI/PythonService/benchmarks/bench_suite.py
+"""
+Reproducible benchmark suite: speed, peak memory and detection accuracy, as JSON that
+can be compared between commits.
+
+Cases (forms come from synthetic_forms.py, registries are seeded samples.csv files):
+
+  analyze_pen_marks         analyze_pen_marks_from_pdf, layout-descriptor path   + accuracy
+  analyze_pen_marks_search  same forms without the descriptor (text-search path) + accuracy
+  extract_text              extract_text_from_pdf_bytes
+  generate_form             POST /generate-form   (per registry size)
+  finalize_form             POST /finalize-form   (per registry size; scans uploaded via /analyze first)
+  lookup                    GET /lookup by labnummer / personnummer (per registry size; also
+                            reports the first, index-building lookup)
+  samples                   GET /samples (per registry size): one person's history, and pages of
+                            a month's registrations -- the first page and one reached by cursor
+  startup                   cold start: fresh interpreters importing main.py and running its
+                            startup hook (warm-up included); p50/p99 are seconds-since-process-start
+                            at "ready" in ms, plus import time and per-step warm-up (see warmup.py)
+
+Every case runs in a fresh child process with its own DIGLAB_DATA_DIR, so peak RSS is
+per case (pool workers are reported separately) and nothing touches the service's data.
+
+  python3 benchmarks/bench_suite.py [--rows 1000,10000,100000,1000000] [-n 40] [--out bench.json]
+  python3 benchmarks/bench_suite.py --out new.json --compare old.json
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+HERE = Path(__file__).resolve().parent
+SERVICE = HERE.parent
+sys.path.insert(0, str(SERVICE))
+sys.path.insert(0, str(HERE))
+
+PDF_CASES = ("analyze_pen_marks", "analyze_pen_marks_search", "extract_text")
+HTTP_CASES = ("generate_form", "finalize_form", "lookup", "samples")
+STARTUP_RUNS = 5  # fresh processes per startup case (at most -n)
+STARTUP_SCRIPT = """
+import json, main
+from fastapi.testclient import TestClient
+with TestClient(main.app):
+    print(json.dumps(main.STARTUP))
+"""
+DEFAULT_ROWS = "1000,10000,100000,1000000"
+WARMUP = 3
+
+
+# ------------------------------------------------------------------ measuring
+def percentile(sorted_ms: list[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    i = min(len(sorted_ms) - 1, max(0, round(q / 100.0 * len(sorted_ms) + 0.5) - 1))
+    return sorted_ms[i]
+
+
+def timed(op: Callable[[Any], Any], items: list, warmup: Optional[list] = None) -> tuple[dict, list]:
+    """Run op over `items` after a few untimed calls (`warmup`, default the first items) -> (summary, results)."""
+    for item in items[:WARMUP] if warmup is None else warmup:
+        op(item)
+    lat: list[float] = []
+    out = []
+    t0 = time.perf_counter()
+    for item in items:
+        s = time.perf_counter()
+        out.append(op(item))
+        lat.append((time.perf_counter() - s) * 1000.0)
+    total = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "n": len(items),
+        "ops_per_s": round(len(items) / total, 2) if total else None,
+        "mean_ms": round(sum(lat) / len(lat), 3),
+        "p50_ms": round(percentile(lat, 50), 3),
+        "p99_ms": round(percentile(lat, 99), 3),
+        "max_ms": round(lat[-1], 3),
+    }, out
+
+
+def peak_rss() -> dict:
+    # ru_maxrss is KiB on Linux
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+# ------------------------------------------------------------------ fixtures
+def registry_csv(workdir: Path, rows: int, seed: int) -> Path:
+    """Seeded samples.csv with `rows` registrations (cached in workdir)."""
+    from sample_store import FIELDNAMES
+
+    path = workdir / f"registry-{rows}-{seed}.csv"
+    if path.exists():
+        return path
+    rng = random.Random(seed)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(FIELDNAMES)
+        for i in range(rows):
+            day = f"2025{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+            w.writerow([f"LAB-{day}-{i:08X}", f"{rng.randrange(10**10, 10**11)}",
+                        f"{day[:4]}-{day[4:6]}-{day[6:]}", f"{rng.randint(7, 17):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+                        "2025-01-01T00:00:00"])
+    os.replace(tmp, path)
+    return path
+
+
+def registry_keys(csv_path: Path, n: int, seed: int) -> list[tuple[str, str]]:
+    """n random (labnummer, personnummer) pairs present in the registry."""
+    with csv_path.open(newline="", encoding="utf-8") as f:
+        rows = [(r[0], r[1]) for r in csv.reader(f)][1:]
+    return random.Random(seed).sample(rows, min(n, len(rows)))
+
+
+# ------------------------------------------------------------------ cases (child process)
+def run_pdf_case(case: str, n: int, seed: int) -> dict:
+    from pdf_analysis import analyze_pen_marks_from_pdf, extract_text_from_pdf_bytes
+    from synthetic_forms import score, synthetic_forms
+
+    forms = list(synthetic_forms(n, seed, layout=case != "analyze_pen_marks_search"))
+    if case == "extract_text":
+        stats, _ = timed(lambda f: extract_text_from_pdf_bytes(f.pdf), forms)
+        return stats
+    stats, marks = timed(lambda f: analyze_pen_marks_from_pdf(f.pdf, requested_only=set(f.kinds)), forms)
+    return {**stats, **score(forms, marks)}
+
+
+def run_http_case(case: str, n: int, seed: int, rows: int, registry: Path) -> dict:
+    from fastapi.testclient import TestClient
+
+    import main  # reads DIGLAB_DATA_DIR, set by the parent
+    from pdf_analysis import DIAGNOSES
+
+    extra: dict[str, Any] = {}
+    with TestClient(main.app) as client:
+        if case == "generate_form":
+            diag = DIAGNOSES
+            bodies = [{"name": f"Bench Patient {i}", "date": "2025-03-01", "time": "10:00",
+                       "diagnoses": diag[: 1 + i % len(diag)]} for i in range(n + WARMUP)]
+            post = lambda b: client.post("/generate-form", json=b).status_code  # noqa: E731
+            stats, codes = timed(post, bodies[:n], warmup=bodies[n:])  # distinct bodies: no form-cache hits
+
+        elif case == "finalize_form":
+            from synthetic_forms import synthetic_forms
+
+            labs = []
+            for form in synthetic_forms(n, seed):
+                r = client.post("/analyze", files={"file": ("scan.pdf", form.pdf, "application/pdf")})
+                labs.append(r.json()["labnummer"])
+            payloads = [{"labnummer": lab, "results": [{"diagnosis": d, "final": "positive"} for d in DIAGNOSES[:2]]}
+                        for lab in labs]
+            stats, codes = timed(lambda p: client.post("/finalize-form", json=p).status_code, payloads)
+
+        elif case == "samples":
+            keys = registry_keys(registry, n, seed)
+            client.get("/samples", params={"limit": 1})  # parses + indexes the CSV
+            queries = []
+            for i, (_, pnr) in enumerate(keys):
+                if i % 2:
+                    queries.append({"personnummer": pnr})
+                    continue
+                month = {"from": f"2025-{1 + i % 12:02d}-01", "to": f"2025-{1 + i % 12:02d}-28", "limit": 50}
+                if i % 4 == 2:
+                    month["cursor"] = client.get("/samples", params=month).json()["nextCursor"]
+                queries.append(month)
+            stats, codes = timed(lambda q: client.get("/samples", params=q).status_code, queries)
+
+        else:  # lookup
+            keys = registry_keys(registry, n, seed)
+            t = time.perf_counter()
+            first = client.get("/lookup", params={"labnummer": keys[0][0]}).status_code
+            extra["first_lookup_ms"] = round((time.perf_counter() - t) * 1000.0, 3)  # parses + indexes the CSV
+            queries = [{"labnummer": lab} if i % 2 else {"personnummer": pnr} for i, (lab, pnr) in enumerate(keys)]
+            stats, codes = timed(lambda q: client.get("/lookup", params=q).status_code, queries)
+            codes.append(first)
+
+    extra["errors"] = sum(c != 200 for c in codes)
+    return {**stats, **extra}
+
+
+def run_startup_case(n: int) -> dict:
+    runs = []
+    for _ in range(min(n, STARTUP_RUNS)):
+        with tempfile.TemporaryDirectory() as data:
+            proc = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=SERVICE, capture_output=True, text=True,
+                                  env=dict(os.environ, DIGLAB_DATA_DIR=data), check=True)
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    ready = sorted(r["ready"] * 1000.0 for r in runs if r.get("ready") is not None)
+    if not ready:
+        return {"n": len(runs), "error": "no process start time on this platform"}
+    return {
+        "n": len(runs),
+        "p50_ms": round(percentile(ready, 50), 1),
+        "p99_ms": round(percentile(ready, 99), 1),
+        "imported_p50_ms": round(percentile(sorted(r["imported"] * 1000.0 for r in runs), 50), 1),
+        "warmup_s": runs[-1]["warmup"],
+        "modules_at_import": runs[-1]["importedModules"],
+    }
+
+
+def child(args: argparse.Namespace) -> None:
+    if args.child in PDF_CASES:
+        res = run_pdf_case(args.child, args.n, args.seed)
+    elif args.child == "startup":
+        res = run_startup_case(args.n)
+    else:
+        res = run_http_case(args.child, args.n, args.seed, int(args.rows), Path(args.registry))
+    print(json.dumps({**res, **peak_rss()}))
+
+
+# ------------------------------------------------------------------ orchestration
+def run_child(case: str, args: argparse.Namespace, workdir: Path, rows: Optional[int] = None) -> dict:
+    env = dict(os.environ, DIGLAB_STORAGE_MAINTENANCE_S="0", PYTHONWARNINGS="ignore")
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--child", case, "-n", str(args.n), "--seed", str(args.seed)]
+    data = None
+    if rows is not None:
+        registry = registry_csv(workdir, rows, args.seed)
+        data = Path(tempfile.mkdtemp(prefix=f"{case}-{rows}-", dir=workdir))
+        shutil.copyfile(registry, data / "samples.csv")
+        env["DIGLAB_DATA_DIR"] = str(data)
+        cmd += ["--rows", str(rows), "--registry", str(registry)]
+    try:
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, cwd=SERVICE)
+    finally:
+        if data is not None:
+            shutil.rmtree(data, ignore_errors=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1:] or ["failed"]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> Optional[str]:
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=SERVICE, capture_output=True, text=True)
+    except OSError:
+        return None
+    if head.returncode != 0:
+        return None
+    return head.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+
+def compare(new: dict, old: dict, threshold: float) -> None:
+    """Print new vs old per (case, rows); flags p50/p99 slowdowns and accuracy drops."""
+    before = {(r["case"], r.get("rows")): r for r in old.get("results", [])}
+    print(f"\ncompared with {old.get('commit')} ({old.get('created')})")
+    print(f"{'case':<26}{'rows':>9}{'p50 ms':>18}{'p99 ms':>18}{'peak MB':>16}{'accuracy':>18}")
+
+    def cell(a: Optional[float], b: Optional[float], worse_if_higher: bool = True) -> str:
+        if a is None or b is None:
+            return f"{'-' if b is None else b:>16}"
+        delta = (b - a) / a * 100.0 if a else 0.0
+        bad = delta > threshold if worse_if_higher else delta < -threshold
+        return f"{b:>9}{delta:>+6.0f}%{'!' if bad else ' '}"
+
+    for r in new["results"]:
+        o = before.get((r["case"], r.get("rows")), {})
+        print(f"{r['case']:<26}{r.get('rows') or '-':>9}  {cell(o.get('p50_ms'), r.get('p50_ms'))}"
+              f"  {cell(o.get('p99_ms'), r.get('p99_ms'))}  {cell(o.get('peak_rss_mb'), r.get('peak_rss_mb'))}"
+              f"  {cell(o.get('accuracy'), r.get('accuracy'), worse_if_higher=False)}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=40, help="operations (forms / requests) per case")
+    ap.add_argument("--rows", default=DEFAULT_ROWS, help="registry sizes for the HTTP cases (comma separated)")
+    ap.add_argument("--cases", default=",".join(PDF_CASES + HTTP_CASES + ("startup",)))
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", type=Path, default=Path("bench.json"))
+    ap.add_argument("--compare", type=Path, help="earlier --out file to compare against")
+    ap.add_argument("--threshold", type=float, default=10.0, help="%% change flagged by --compare")
+    ap.add_argument("--workdir", type=Path, help="keep generated registries here between runs")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--registry", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args)
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    sizes = [int(r) for r in args.rows.split(",") if r.strip()]
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="diglab-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "n": args.n,
+        "seed": args.seed,
+        "results": [],
+    }
+    try:
+        plan: list[tuple[str, Optional[int]]] = [(c, None) for c in cases if c in PDF_CASES]
+        plan += [(c, rows) for c in cases if c in HTTP_CASES for rows in sizes]
+        plan += [("startup", None)] if "startup" in cases else []
+        for case, rows in plan:
+            res = {"case": case, "rows": rows, **run_child(case, args, workdir, rows)}
+            report["results"].append(res)
+            summary = ", ".join(f"{k}={res[k]}" for k in ("ops_per_s", "p50_ms", "p99_ms", "peak_rss_mb", "accuracy",
+                                                          "first_lookup_ms", "imported_p50_ms", "error") if k in res)
+            print(f"{case:<26}{rows or '':>9}  {summary}", flush=True)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    args.out.write_text(json.dumps(report, indent=1), encoding="utf-8")
+    print(f"-> {args.out}")
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text(encoding="utf-8")), args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# backEnd/DigLabAPI/PythonService/benchmarks/fake_printer.py
+"""
+Stand-in for a label printer's raw TCP port (9100), to try gen_barcode.py --print
+without a Zebra. It reads each job at a limited rate, like a printer draining its small
+receive buffer, so the sender feels back-pressure. It counts the labels (^XZ) in each
+job and can keep every job as a .zpl file.
+
+  python3 benchmarks/fake_printer.py [--port 9100] [--labels-per-second 20] [--out DIR]
+  python3 gen_barcode.py --print tcp://127.0.0.1:9100 --all
+
+  python3 benchmarks/fake_printer.py --selftest [-n 5000]
+      sends n labels through gen_barcode.print_labels to a throttled printer and checks
+      that every label arrived in one job and that the sender was paced by the printer.
+      It also checks that a printer that stops reading fails the job after the timeout.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+RECV_BYTES = 4096  # what a printer takes per read
+END = b"^XZ"
+
+
+class FakePrinter:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, rate: float = 0.0,
+                 out: Optional[Path] = None, stall: bool = False):
+        self.rate = rate    # labels per second, 0 = as fast as possible
+        self.out = out
+        self.stall = stall  # accept jobs but never read them
+        self.jobs: list[dict] = []
+        self.done = threading.Condition()
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BYTES)  # inherited by jobs
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+
+    def serve(self) -> None:
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:  # closed
+                return
+            threading.Thread(target=self._job, args=(conn,), daemon=True).start()
+
+    def start(self) -> "FakePrinter":
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def _job(self, conn: socket.socket) -> None:
+        t0 = time.perf_counter()
+        data = bytearray()
+        with conn:
+            if self.stall:
+                time.sleep(3600)
+            while True:
+                chunk = conn.recv(RECV_BYTES)
+                if not chunk:
+                    break
+                before = data.count(END)
+                data += chunk
+                if self.rate:
+                    time.sleep((data.count(END) - before) / self.rate)
+        job = {"labels": data.count(END), "bytes": len(data), "seconds": round(time.perf_counter() - t0, 3)}
+        if self.out is not None:
+            self.out.mkdir(parents=True, exist_ok=True)
+            (self.out / f"job-{len(self.jobs) + 1:04d}.zpl").write_bytes(bytes(data))
+        with self.done:
+            self.jobs.append(job)
+            self.done.notify_all()
+        print(f"job {len(self.jobs)}: {json.dumps(job)}", flush=True)
+
+    def wait_jobs(self, n: int, timeout: float = 60.0) -> list[dict]:
+        with self.done:
+            self.done.wait_for(lambda: len(self.jobs) >= n, timeout)
+            return list(self.jobs)
+
+
+def selftest(n: int, rate: float) -> int:
+    import gen_barcode
+
+    labs = [f"LAB-20250301-{i:08X}" for i in range(n)]
+    failures = []
+
+    printer = FakePrinter(rate=rate).start()
+    t0 = time.perf_counter()
+    sent = gen_barcode.print_labels(labs, f"tcp://127.0.0.1:{printer.port}")
+    send_s = time.perf_counter() - t0
+    jobs = printer.wait_jobs(1)
+    printer.close()
+    if len(jobs) != 1 or jobs[0]["labels"] != n or jobs[0]["bytes"] != sent["bytes"]:
+        failures.append(f"sent {sent}, printer got {jobs}")
+    # Kernel buffers hold some of the job; the rest can only go as fast as the printer reads
+    if rate and send_s < 0.5 * n / rate:
+        failures.append(f"sender finished in {send_s:.2f} s, printer needs {n / rate:.2f} s: no back-pressure")
+
+    stalled = FakePrinter(stall=True).start()
+    gen_barcode.PRINT_TIMEOUT = 1.0
+    partial = {"labels": 0, "bytes": 0}
+    try:
+        gen_barcode.print_labels(labs, f"tcp://127.0.0.1:{stalled.port}", partial)
+        failures.append("job to a stalled printer did not time out")
+    except OSError:
+        pass
+    stalled.close()
+
+    print(json.dumps({
+        "labels": n,
+        "jobBytes": sent["bytes"],
+        "printerLabelsPerSecond": rate,
+        "sendSeconds": round(send_s, 2),
+        "printerSeconds": jobs[0]["seconds"] if jobs else None,
+        "stalledPrinterLabelsBeforeTimeout": partial["labels"],
+        "failures": failures,
+    }, indent=1))
+    return 1 if failures else 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--labels-per-second", type=float, help="print speed (0 = unlimited; default 20, --selftest 2000)")
+    ap.add_argument("--out", type=Path, help="keep each job as DIR/job-NNNN.zpl")
+    ap.add_argument("--selftest", action="store_true")
+    ap.add_argument("-n", type=int, default=5000, help="labels sent by --selftest")
+    args = ap.parse_args()
+
+    if args.selftest:
+        sys.exit(selftest(args.n, 2000.0 if args.labels_per_second is None else args.labels_per_second))
+    rate = 20.0 if args.labels_per_second is None else args.labels_per_second
+    printer = FakePrinter(args.host, args.port, rate, args.out)
+    print(f"fake printer on {args.host}:{printer.port} ({rate:g} labels/s)", flush=True)
+    try:
+        printer.serve()
+    except KeyboardInterrupt:
+        printer.close()
+
+
+if __name__ == "__main__":
+    main()
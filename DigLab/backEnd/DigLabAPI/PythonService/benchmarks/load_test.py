@@ -0,0 +1,234 @@
+# backEnd/DigLabAPI/PythonService/benchmarks/load_test.py
+"""
+Multi-worker load test: concurrent clients run the whole sample workflow against
+`uvicorn main:app --workers N` on one data directory, so consecutive requests for a
+sample land on different worker processes:
+
+  register -> lookup -> generate-form -> analyze (pen-marked form) -> finalize-form
+
+Afterwards samples.csv is checked: every row complete (no interleaved or torn writes),
+one row per registration, every lookup answered. Exits 1 on any failure.
+
+  python3 benchmarks/load_test.py [--workers 4] [--clients 16] [--rounds 10]
+  python3 benchmarks/load_test.py --url http://host:8000 --data-dir /shared/diglab   # running service
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz  # PyMuPDF
+import httpx
+
+from form_layout import read_layout
+from synthetic_forms import draw_cross
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+STEPS = ("register", "lookup", "generate-form", "analyze", "finalize-form")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(workers: int, data_dir: Path, port: int) -> subprocess.Popen:
+    env = dict(os.environ, DIGLAB_DATA_DIR=str(data_dir))
+    env.setdefault("DIGLAB_ANALYZE_WORKERS", "1")  # per service worker
+    env.setdefault("DIGLAB_RENDER_WORKERS", "1")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+
+
+def wait_ready(url: str, proc: Optional[subprocess.Popen], timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            sys.exit(f"service exited with {proc.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"service not ready after {timeout:.0f} s")
+
+
+def mark_form(pdf: bytes, diagnosis: str, rng: random.Random) -> bytes:
+    """Pen cross in the Positive box of `diagnosis`."""
+    with fitz.open("pdf", pdf) as doc:
+        boxes = read_layout(doc)["rows"][diagnosis]["boxes"]
+        draw_cross(doc[0], fitz.Rect(boxes["positive"]), rng)
+        return doc.tobytes(garbage=1, deflate=True)
+
+
+class Client(threading.Thread):
+    def __init__(self, url: str, index: int, rounds: int):
+        super().__init__(name=f"client-{index}")
+        self.url, self.index, self.rounds = url, index, rounds
+        self.rng = random.Random(index)
+        self.registered: dict[str, str] = {}  # labnummer -> personnummer
+        self.latency: dict[str, list[float]] = {s: [] for s in STEPS}
+        self.failures: list[str] = []
+
+    def call(self, http: httpx.Client, step: str, method: str, path: str, **kw) -> Optional[httpx.Response]:
+        for _ in range(10):  # 503 = analysis queue full: honour Retry-After
+            t0 = time.perf_counter()
+            r = http.request(method, f"{self.url}{path}", **kw)
+            if r.status_code != 503:
+                break
+            time.sleep(float(r.headers.get("Retry-After", "1")))
+        self.latency[step].append(time.perf_counter() - t0)
+        if r.status_code != 200:
+            self.failures.append(f"{step}: HTTP {r.status_code} {r.text[:120]}")
+            return None
+        return r
+
+    def run(self) -> None:
+        with httpx.Client(timeout=120) as http:
+            for i in range(self.rounds):
+                try:
+                    self.workflow(http, i)
+                except httpx.HTTPError as e:
+                    self.failures.append(f"{type(e).__name__}: {e}")
+
+    def workflow(self, http: httpx.Client, i: int) -> None:
+        pp = f"{self.index % 100:02d}{i % 1000:03d}{self.rng.randrange(10**6):06d}"
+        r = self.call(http, "register", "POST", "/register", json={"personnummer": pp, "date": "2025-03-01", "time": "10:00"})
+        if r is None:
+            return
+        lab = r.json()["labnummer"]
+        self.registered[lab] = pp
+
+        r = self.call(http, "lookup", "GET", "/lookup", params={"labnummer": lab})
+        if r is not None and r.json().get("personnummer") != pp:
+            self.failures.append(f"lookup: {lab} -> {r.json()}")
+
+        diagnosis = "Dengue"
+        r = self.call(http, "generate-form", "POST", "/generate-form", json={
+            "name": f"Load Test {self.index}-{i}", "date": "2025-03-01", "time": "10:00",
+            "diagnoses": [diagnosis, "TBE"], "personnummer": pp, "labnummer": lab,
+        })
+        if r is None:
+            return
+
+        scan = mark_form(r.content, diagnosis, self.rng)
+        r = self.call(http, "analyze", "POST", "/analyze", files={"file": (f"{lab}.pdf", scan, "application/pdf")})
+        if r is None:
+            return
+        if r.json().get("labnummer") != lab:
+            self.failures.append(f"analyze: {lab} read as {r.json().get('labnummer')}")
+
+        r = self.call(http, "finalize-form", "POST", "/finalize-form", json={
+            "labnummer": lab, "results": [{"diagnosis": diagnosis, "final": "Positive", "auto": "positive"}],
+        })
+        if r is not None and not r.content.startswith(b"%PDF"):
+            self.failures.append(f"finalize-form: {lab} returned no PDF")
+
+
+def check_csv(path: Path, registered: dict[str, str]) -> list[str]:
+    """Every row complete and parseable, exactly one per registration."""
+    problems: list[str] = []
+    raw = path.read_bytes()
+    if raw and not raw.endswith(b"\n"):
+        problems.append("samples.csv: last row not terminated")
+    rows = list(csv.reader(raw.decode("utf-8").splitlines()))
+    header, rows = rows[0], rows[1:]
+    seen: dict[str, int] = {}
+    for n, row in enumerate(rows, 2):
+        if len(row) != len(header):
+            problems.append(f"samples.csv:{n}: {len(row)} fields, expected {len(header)}: {row!r:.120}")
+            continue
+        seen[row[0]] = seen.get(row[0], 0) + 1
+        if row[0] in registered and row[1] != registered[row[0]]:
+            problems.append(f"samples.csv:{n}: {row[0]} has personnummer {row[1]}")
+    for lab in registered:
+        if seen.get(lab, 0) != 1:
+            problems.append(f"samples.csv: {lab} appears {seen.get(lab, 0)} times")
+    return problems
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    ap.add_argument("--clients", type=int, default=16, help="concurrent client threads")
+    ap.add_argument("--rounds", type=int, default=10, help="workflows per client")
+    ap.add_argument("--url", help="test a running service instead of starting one")
+    ap.add_argument("--data-dir", type=Path, help="its DIGLAB_DATA_DIR (to check samples.csv)")
+    args = ap.parse_args()
+
+    proc = None
+    tmp = None
+    url = args.url
+    data_dir = args.data_dir
+    if url is None:
+        tmp = tempfile.TemporaryDirectory(prefix="diglab-load-")
+        data_dir = Path(tmp.name)
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        proc = start_service(args.workers, data_dir, port)
+    try:
+        wait_ready(url, proc)
+        clients = [Client(url, i, args.rounds) for i in range(args.clients)]
+        t0 = time.perf_counter()
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        elapsed = time.perf_counter() - t0
+    finally:
+        if proc is not None:
+            proc.terminate()  # graceful: workers flush queued registrations
+            proc.wait(timeout=60)
+
+    registered = {lab: pp for c in clients for lab, pp in c.registered.items()}
+    failures = [f for c in clients for f in c.failures]
+    if data_dir is not None:
+        failures += check_csv(data_dir / "samples.csv", registered)
+    report = {
+        "workers": args.workers if args.url is None else None,
+        "clients": args.clients,
+        "workflows": args.clients * args.rounds,
+        "registered": len(registered),
+        "seconds": round(elapsed, 2),
+        "workflowsPerSecond": round(args.clients * args.rounds / elapsed, 2),
+        "latencyMs": {
+            s: {"p50": percentile(v, 0.5), "p95": percentile(v, 0.95)}
+            for s in STEPS for v in [[x for c in clients for x in c.latency[s]]]
+        },
+        "failures": len(failures),
+    }
+    print(json.dumps(report, indent=1))
+    for f in failures[:20]:
+        print("FAIL", f, file=sys.stderr)
+    if tmp is not None:
+        tmp.cleanup()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
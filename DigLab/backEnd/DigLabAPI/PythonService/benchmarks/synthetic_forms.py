@@ -0,0 +1,138 @@
+# backEnd/DigLabAPI/PythonService/benchmarks/synthetic_forms.py
+"""
+Reproducible pen-marked requisitions for benchmarks and accuracy checks.
+
+Each form is built with pdf_form.generate_lab_form_pdf and every requested row gets
+ink annotations (rendered by /analyze like real pen strokes) at its Positive/Negative
+boxes, with seeded jitter in stroke width and position:
+
+  positive   cross in the Positive box           -> expected "positive"
+  negative   cross in the Negative box           -> expected "negative"
+  ambiguous  crosses in both boxes               -> no expected answer (reported separately)
+  empty      nothing marked                      -> expected "none"
+
+With layout=False the layout descriptor is removed, so analysis takes the text-search
+path used for foreign PDFs.
+
+  python3 benchmarks/synthetic_forms.py -n 40 OUT_DIR     # writes PDFs + truth.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz  # PyMuPDF
+
+from form_layout import LAYOUT_KEY, info_xref, read_layout
+from form_qr import qr_png
+from pdf_form import ALL_DIAGNOSES, generate_lab_form_pdf
+
+MARK_KINDS = ("positive", "negative", "ambiguous", "empty")
+EXPECTED = {"positive": "positive", "negative": "negative", "ambiguous": None, "empty": "none"}
+
+
+@dataclass
+class SyntheticForm:
+    labnummer: str
+    pdf: bytes
+    kinds: dict[str, str] = field(default_factory=dict)  # requested diagnosis -> mark kind
+
+    def expected(self) -> dict[str, Optional[str]]:
+        """Diagnosis -> expected mark (None: ambiguous, not scored); unrequested rows are "none"."""
+        return {d: EXPECTED[self.kinds[d]] if d in self.kinds else "none" for d in ALL_DIAGNOSES}
+
+
+def draw_cross(page: fitz.Page, box: fitz.Rect, rng: random.Random) -> None:
+    """Hand-drawn pen cross (ink annotation) in `box`."""
+    j = lambda: rng.uniform(-1.0, 1.0)  # noqa: E731 - hand tremor, in points
+    x0, y0, x1, y1 = box.x0 + 3 + j(), box.y0 + 2 + j(), box.x1 - 3 + j(), box.y1 - 2 + j()
+    annot = page.add_ink_annot([[(x0, y0), (x1, y1)], [(x0, y1), (x1, y0)]])
+    annot.set_border(width=rng.choice((1.0, 1.5, 2.5)))
+    annot.set_colors(stroke=rng.choice(((0, 0, 0), (0, 0, 0.6))))
+    annot.update()
+
+
+def make_form(i: int, rng: random.Random, tmp: Path, layout: bool = True) -> SyntheticForm:
+    labnummer = f"LAB-20250301-{i:08X}"
+    requested = rng.sample(ALL_DIAGNOSES, rng.randint(1, len(ALL_DIAGNOSES)))
+    out = tmp / f"{labnummer}.pdf"
+    generate_lab_form_pdf(
+        out, labnummer=labnummer, name=f"Synthetic Patient {i}", date="2025-03-01", time="10:00",
+        diagnoses=requested, qr_png=qr_png(labnummer), personnummer=f"0101011{i % 10000:04d}",
+    )
+    form = SyntheticForm(labnummer, b"")
+    with fitz.open(out) as doc:
+        page = doc[0]
+        rows = read_layout(doc)["rows"]
+        for d in requested:
+            kind = rng.choice(MARK_KINDS)
+            form.kinds[d] = kind
+            boxes = rows[d]["boxes"]
+            if kind in ("positive", "ambiguous"):
+                draw_cross(page, fitz.Rect(boxes["positive"]), rng)
+            if kind in ("negative", "ambiguous"):
+                draw_cross(page, fitz.Rect(boxes["negative"]), rng)
+        if not layout:
+            doc.xref_set_key(info_xref(doc), LAYOUT_KEY, "null")
+        form.pdf = doc.tobytes(garbage=1, deflate=True)
+    out.unlink()
+    return form
+
+
+def synthetic_forms(n: int, seed: int = 1, layout: bool = True) -> Iterator[SyntheticForm]:
+    """`n` forms; the same (n, seed, layout) always gives the same forms and marks."""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as d:
+        for i in range(n):
+            yield make_form(i, rng, Path(d), layout=layout)
+
+
+def score(forms: list[SyntheticForm], marks: list[dict[str, str]]) -> dict:
+    """Accuracy of analysed `marks` against the forms' truth (ambiguous rows counted apart)."""
+    correct = scored = 0
+    confusion: dict[str, dict[str, int]] = {}
+    ambiguous: dict[str, int] = {}
+    for form, got in zip(forms, marks):
+        for d, want in form.expected().items():
+            if want is None:
+                ambiguous[got[d]] = ambiguous.get(got[d], 0) + 1
+                continue
+            scored += 1
+            correct += got[d] == want
+            row = confusion.setdefault(want, {})
+            row[got[d]] = row.get(got[d], 0) + 1
+    return {
+        "accuracy": round(correct / scored, 4) if scored else None,
+        "rows_scored": scored,
+        "confusion": confusion,  # expected -> {detected: count}
+        "ambiguous": ambiguous,  # detected -> count
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("out", type=Path)
+    ap.add_argument("-n", type=int, default=40)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--no-layout", action="store_true", help="strip the layout descriptor (text-search path)")
+    args = ap.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    truth = {}
+    for form in synthetic_forms(args.n, args.seed, layout=not args.no_layout):
+        (args.out / f"{form.labnummer}.pdf").write_bytes(form.pdf)
+        truth[form.labnummer] = form.expected()
+    (args.out / "truth.json").write_text(json.dumps(truth, indent=1, ensure_ascii=False), encoding="utf-8")
+    print(f"{len(truth)} forms -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
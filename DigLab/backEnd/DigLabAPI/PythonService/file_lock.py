@@ -0,0 +1,69 @@
+# backEnd/DigLabAPI/PythonService/file_lock.py
+"""
+Exclusive lock shared by the threads of a process and by every process using the same
+lock file: uvicorn --workers N, several replicas on one shared data directory, and the
+CLI tools (register_lab.py).
+
+Threads serialise on an RLock (so the lock is re-entrant per thread); the first level
+also takes flock(LOCK_EX) on `path`. The lock file is opened once per process
+(again after fork: a descriptor shared with the parent would not exclude it).
+flock works across hosts on NFSv4 (Linux emulates it with POSIX locks there);
+without fcntl (Windows) only threads are serialised.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None  # type: ignore[assignment]
+
+LOCK_SUFFIX = ".lock"
+
+
+class FileLock:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+        self._pid = 0
+
+    def _open(self) -> int:
+        if self._fd is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._rlock.acquire(blocking):
+            return False
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fcntl.flock(self._open(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:  # LOCK_NB: held by another process
+                self._rlock.release()
+                return False
+            except BaseException:
+                self._rlock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
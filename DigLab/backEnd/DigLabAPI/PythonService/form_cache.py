@@ -0,0 +1,62 @@
+# backEnd/DigLabAPI/PythonService/form_cache.py
+"""
+In-memory cache of rendered requisitions for /generate-form.
+
+Kept free of PyMuPDF/ReportLab so main.py can create it without loading the
+rendering stack (see form_template.py for the renderer).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+TEMPLATE_VERSION = 1  # bump when the form template changes: old cache keys / ETags stop matching
+
+
+class FormCache:
+    """
+    Bounded LRU of rendered requisitions, keyed by a digest of the request fields
+    (also used as the response ETag). Evicts least recently used forms above `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(**fields) -> str:
+        blob = json.dumps({"template": TEMPLATE_VERSION, **fields}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            pdf = self._items.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key: str, pdf: bytes) -> None:
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = pdf
+            self._size += len(pdf)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,107 @@
+# backEnd/DigLabAPI/PythonService/form_layout.py
+"""
+Versioned layout descriptor embedded in generated requisition PDFs.
+
+pdf_form.py writes it (as a custom /DigLabLayout entry in the PDF Info dictionary)
+and /analyze + /finalize-form read it back instead of searching the page text.
+Coordinates are PyMuPDF page coordinates (points, origin top-left), e.g.
+
+  {"v": 1, "labnummer": "LAB-...", "page": 0, "page_size": [595.28, 841.89],
+   "rows": {"Dengue": {"requested": true,
+                       "boxes": {"requested": [x0, y0, x1, y1], "positive": [...], "negative": [...]}}},
+   "signature": {"page": 0, "y": 501.0}}
+
+Box rects match what PyMuPDF reports for the checkbox tokens (font ascender/descender),
+so ROIs built from them are the same as on the search path.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+from artifact_store import ArtifactStore
+
+LAYOUT_KEY = "DigLabLayout"
+LAYOUT_VERSION = 1
+
+
+def info_xref(doc: fitz.Document) -> int:
+    """xref of the document's Info dictionary (0 if it has none)."""
+    kind, val = doc.xref_get_key(-1, "Info")
+    return int(val.split()[0]) if kind == "xref" else 0
+
+def write_layout(doc: fitz.Document, layout: dict) -> None:
+    """Store `layout` in an open document (caller saves it)."""
+    xref = info_xref(doc)
+    if not xref:
+        doc.set_metadata(doc.metadata or {})  # creates the Info dictionary
+        xref = info_xref(doc)
+    data = json.dumps({"v": LAYOUT_VERSION, **layout}, separators=(",", ":"), ensure_ascii=True)
+    doc.xref_set_key(xref, LAYOUT_KEY, fitz.get_pdf_str(data))
+
+def embed_layout(pdf_path: Path, layout: dict) -> None:
+    """Append the descriptor to an existing PDF file as an incremental update."""
+    with fitz.open(pdf_path) as doc:
+        write_layout(doc, layout)
+        doc.saveIncr()
+
+def read_layout(doc: fitz.Document) -> Optional[dict]:
+    """Descriptor of a DigLab-generated PDF, or None for foreign/rasterised documents."""
+    xref = info_xref(doc)
+    if not xref:
+        return None
+    kind, val = doc.xref_get_key(xref, LAYOUT_KEY)
+    if kind != "string":
+        return None
+    try:
+        layout = json.loads(val)
+    except ValueError:
+        return None
+    if not isinstance(layout, dict) or layout.get("v") != LAYOUT_VERSION:
+        return None
+
+    # Only trust it if the page still has the geometry it was generated for
+    page_no = layout.get("page", 0)
+    if page_no >= len(doc):
+        return None
+    w, h = layout.get("page_size") or (0, 0)
+    r = doc[page_no].rect
+    if abs(r.width - w) > 0.5 or abs(r.height - h) > 0.5:
+        return None
+    return layout
+
+def fit_layout(layout: dict, width: float, height: float) -> dict:
+    """`layout` mapped onto a page of another size (a scan of the form) by simple scaling."""
+    w, h = layout["page_size"]
+    if abs(w - width) <= 0.5 and abs(h - height) <= 0.5:
+        return layout
+    sx, sy = width / w, height / h
+    rows = {
+        d: {**row, "boxes": {k: [x0 * sx, y0 * sy, x1 * sx, y1 * sy] for k, (x0, y0, x1, y1) in row["boxes"].items()}}
+        for d, row in layout["rows"].items()
+    }
+    fitted = {**layout, "page_size": [round(width, 3), round(height, 3)], "rows": rows}
+    if layout.get("signature"):
+        fitted["signature"] = {**layout["signature"], "y": layout["signature"]["y"] * sy}
+    return fitted
+
+def requisition_pdf(forms: ArtifactStore | str | None, labnummer: Optional[str]) -> Optional[Path]:
+    """The requisition in the forms store (or its directory, as passed to worker processes)."""
+    if not forms or not labnummer:
+        return None
+    store = forms if isinstance(forms, ArtifactStore) else ArtifactStore(Path(forms))
+    candidates = (f"{labnummer}.pdf", f"DigLab-{labnummer}.pdf")
+    return next((p for p in map(store.locate, candidates) if p), None)
+
+def requisition_layout(form_pdf: Optional[str]) -> Optional[dict]:
+    """Descriptor of a stored requisition: the box positions for scans without a text layer."""
+    if not form_pdf:
+        return None
+    try:
+        with fitz.open(form_pdf) as doc:
+            return read_layout(doc)
+    except Exception:
+        return None
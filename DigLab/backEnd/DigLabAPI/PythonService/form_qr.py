@@ -0,0 +1,128 @@
+# backEnd/DigLabAPI/PythonService/form_qr.py
+"""
+QR payload printed on requisitions, and reading it back from scans without a text layer.
+
+Payload:  "<labnummer>;DX=<hex bitmask>"   e.g. "LAB-20250301-56677E98;DX=5"
+- bit i set  ->  diagnoses[i] was requested (pass the same, fixed diagnosis order both ways)
+- the labnummer stays first, so LABNUM_RE still finds it in the raw payload
+- older forms encode only the labnummer; they decode with requested = None (unknown)
+
+QR images are rendered in memory (qr_png) behind a bounded LRU keyed by payload.
+
+Decoding is a resolution ladder: one low-res render of the whole page first, then only
+the header band (where the QR is printed) at increasing resolution if that fails.
+Needs opencv-python-headless; without it QR recovery is skipped.
+"""
+from __future__ import annotations
+
+import io
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import qrcode
+
+from metrics import stage
+
+DX_RE = re.compile(r";DX=([0-9A-F]+)\b", re.I)
+
+HEADER_BAND = (0.0, 0.0, 1.0, 0.3)  # page fractions (x0, y0, x1, y1)
+QR_LADDER = ((60, None), (120, HEADER_BAND), (240, HEADER_BAND))  # (dpi, band)
+
+QR_CACHE_SIZE = int(os.environ.get("DIGLAB_QR_CACHE", "512"))
+
+_detector = None  # cv2.QRCodeDetector, False if OpenCV isn't installed
+
+
+def encode_payload(labnummer: str, requested: Sequence[str], diagnoses: Sequence[str]) -> str:
+    req = set(requested)
+    mask = sum(1 << i for i, d in enumerate(diagnoses) if d in req)
+    return f"{labnummer};DX={mask:X}"
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_png(payload: str) -> bytes:
+    """PNG bytes of the QR for `payload` (no disk round trip; a form re-rendered for the same payload hits the cache)."""
+    buf = io.BytesIO()
+    with stage("qr_generate"):  # cache misses only
+        qrcode.make(payload).save(buf)
+    return buf.getvalue()
+
+
+def parse_payload(text: str, diagnoses: Sequence[str]) -> tuple[str, Optional[list[str]]]:
+    """
+    Payload -> (id, requested diagnoses or None if the payload doesn't say).
+    `id` is whatever was encoded first; callers check it against LABNUM_RE.
+    """
+    ident = (text or "").split(";", 1)[0].strip()
+    dx = DX_RE.search(text or "")
+    if not dx:
+        return ident, None
+    mask = int(dx.group(1), 16)
+    return ident, [d for i, d in enumerate(diagnoses) if mask >> i & 1]
+
+
+def available() -> bool:
+    """Import OpenCV on first use only; text-layer PDFs never need it."""
+    global _detector
+    if _detector is None:
+        try:
+            import cv2
+            _detector = cv2.QRCodeDetector()
+        except ImportError:  # optional: QR recovery disabled
+            _detector = False
+    return _detector is not False
+
+
+def decode_qr(gray: np.ndarray) -> Optional[str]:
+    if not available() or gray.size == 0:
+        return None
+    try:
+        text, _, _ = _detector.detectAndDecode(np.ascontiguousarray(gray))
+    except Exception:  # cv2.error on degenerate input
+        return None
+    return text or None
+
+
+def scan_qr(render: Callable[[int, Optional[tuple]], Optional[np.ndarray]]) -> Optional[str]:
+    """
+    Walk QR_LADDER, calling render(dpi, band) -> grayscale array (or None to skip the step),
+    and stop at the first step that decodes.
+    """
+    if not available():
+        return None
+    for dpi, band in QR_LADDER:
+        gray = render(dpi, band)
+        if gray is None:
+            continue
+        text = decode_qr(gray)
+        if text:
+            return text
+    return None
+
+
+def scan_gray_qr(gray: np.ndarray, dpi: float) -> Optional[str]:
+    """QR ladder over an already decoded page image of roughly `dpi` resolution."""
+    h, w = gray.shape
+    tried: set[tuple] = set()
+
+    def render(step_dpi: int, band: Optional[tuple]) -> Optional[np.ndarray]:
+        # k > 1: box-downsample, k < 0: nearest-upsample small scans (finer sampling helps the detector)
+        k = int(dpi // step_dpi) if dpi >= step_dpi else -round(step_dpi / dpi)
+        k = 1 if k in (0, -1) else k
+        if (k, band) in tried:
+            return None
+        tried.add((k, band))
+        x0, y0, x1, y1 = band or (0.0, 0.0, 1.0, 1.0)
+        crop = gray[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)]
+        if k == 1:
+            return crop
+        if k < 0:
+            return crop.repeat(-k, axis=0).repeat(-k, axis=1)
+        ch, cw = crop.shape[0] // k * k, crop.shape[1] // k * k
+        return crop[:ch, :cw].reshape(ch // k, k, cw // k, k).mean(axis=(1, 3)).astype(np.uint8)
+
+    with stage("qr_decode"):
+        return scan_qr(render)
@@ -0,0 +1,196 @@
+# backEnd/DigLabAPI/PythonService/form_template.py
+"""
+Requisition forms from a cached template instead of a full ReportLab build per request.
+
+The story in pdf_form.build_form has a fixed layout: the variable fields (name, date, time,
+personnummer, labnummer, QR label, requested [X]/[ ] cells) are single-line strings in
+fixed-width cells, so their content never moves anything else. So:
+
+- once per (hospital, with/without personnummer row, TEMPLATE_VERSION) the form is built
+  with unique placeholder strings and a placeholder QR image, and kept in memory,
+- per request the placeholders are replaced in the page content stream (encoded + escaped
+  exactly like ReportLab writes them), the QR image XObject is overwritten in place,
+  and the layout descriptor is written.
+
+Values that could change the layout (newlines, characters that need a substitute font,
+a QR label that might wrap or carries markup) fall back to the full ReportLab build.
+FormCache (form_cache.py) keeps finished PDFs for /generate-form (content-addressed, ETag).
+Compare both paths with benchmarks/bench_form_template.py.
+"""
+from __future__ import annotations
+
+import io
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import fitz  # PyMuPDF
+from PIL import Image
+from reportlab.lib.rl_accel import escapePDF
+from reportlab.pdfbase.pdfmetrics import getFont, stringWidth, unicode2T1
+
+from form_cache import TEMPLATE_VERSION
+from form_layout import info_xref, write_layout
+from form_qr import qr_png
+from metrics import stage
+from pdf_form import (
+    ALL_DIAGNOSES, BOX_EMPTY, BOX_X, PlacedTable, build_form, form_layout, generate_lab_form_bytes, info_rows,
+)
+
+QR_LABEL_MAX_WIDTH = 400.0  # pt at Helvetica 9; longer labels could wrap -> full build
+
+_SLOT_RE = re.compile(rb"\{\{[a-z0-9_]+\}\}")
+
+
+@dataclass
+class _Template:
+    pdf: bytes
+    content_xrefs: list[int]
+    qr_xref: int
+    diag_tab: PlacedTable
+    sign_tab: PlacedTable
+
+
+_templates: dict[tuple, _Template] = {}
+_templates_lock = threading.Lock()
+
+
+def _slot(name: str) -> str:
+    return "{{" + name + "}}"
+
+
+def _placeholder_png() -> io.BytesIO:
+    buf = io.BytesIO()
+    Image.new("1", (1, 1), 1).save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+
+def _pdf_string(text: str, font: str) -> Optional[bytes]:
+    """`text` as ReportLab writes it inside (...) Tj, or None if it needs a substitute font."""
+    if "\n" in text or "\r" in text:
+        return None
+    f = getFont(font)
+    parts = unicode2T1(text, [f] + f.substitutionFonts)
+    if len(parts) > 1 or (parts and parts[0][0] is not f):
+        return None
+    return escapePDF(parts[0][1] if parts else b"").encode("latin-1")
+
+
+def _set_qr_image(doc: fitz.Document, xref: int, qr_png: Path | bytes) -> None:
+    """Overwrite the template's image XObject in place with the QR (1-bit gray, Flate)."""
+    with Image.open(io.BytesIO(qr_png) if isinstance(qr_png, (bytes, bytearray)) else qr_png) as img:
+        bits = img.convert("1", dither=Image.Dither.NONE)
+    doc.update_stream(xref, bits.tobytes(), compress=True)
+    doc.xref_set_key(xref, "Width", str(bits.width))
+    doc.xref_set_key(xref, "Height", str(bits.height))
+    doc.xref_set_key(xref, "ColorSpace", "/DeviceGray")
+    doc.xref_set_key(xref, "BitsPerComponent", "1")
+
+
+def _build_template(hospital: str, with_pnr: bool) -> _Template:
+    buf = io.BytesIO()
+    diag_tab, sign_tab = build_form(
+        buf,
+        hospital=hospital,
+        qr_png=_placeholder_png(),
+        qr_text=_slot("qr_text"),
+        info_rows=info_rows(
+            name=_slot("name"), date=_slot("date"), time=_slot("time"), labnummer=_slot("labnummer"),
+            personnummer=_slot("personnummer") if with_pnr else None,
+        ),
+        requested_cells=[_slot(f"rq{i}") for i in range(len(ALL_DIAGNOSES))],
+    )
+    pdf = buf.getvalue()
+    with fitz.open("pdf", pdf) as doc:
+        page = doc[0]
+        content_xrefs = page.get_contents()
+        qr_xref = page.get_images()[0][0]
+        pages = len(doc)
+        # Every placeholder must appear exactly once, as one unbroken string
+        found = [m for x in content_xrefs for m in _SLOT_RE.findall(doc.xref_stream(x))]
+    expected = 5 + with_pnr + len(ALL_DIAGNOSES)
+    if pages != 1 or len(found) != expected or len(set(found)) != expected:
+        raise RuntimeError(f"form template for {hospital!r} has unexpected placeholders: {found}")
+    return _Template(pdf, content_xrefs, qr_xref, diag_tab, sign_tab)
+
+
+def _template(hospital: str, with_pnr: bool) -> _Template:
+    key = (hospital, with_pnr, TEMPLATE_VERSION)
+    tpl = _templates.get(key)
+    if tpl is None:
+        with _templates_lock:
+            tpl = _templates.get(key)
+            if tpl is None:
+                tpl = _templates[key] = _build_template(hospital, with_pnr)
+    return tpl
+
+
+def render_lab_form_pdf(out_pdf: Path, **fields) -> None:
+    """Same arguments and output as pdf_form.generate_lab_form_pdf, from the cached template."""
+    Path(out_pdf).write_bytes(render_lab_form_bytes(**fields))
+
+
+def render_lab_form_bytes(
+    *,
+    labnummer: str,
+    name: str,
+    date: str,
+    time: str,
+    diagnoses: List[str],
+    qr_png: Path | bytes,
+    personnummer: str | None = None,
+    hospital: str = "DigLab",
+    qr_label: str | None = None,
+) -> bytes:
+    """The finished requisition PDF as bytes (see render_lab_form_pdf)."""
+    sel = set(diagnoses or [])
+    qr_text = qr_label or labnummer
+    values = {
+        "name": (name, "Helvetica"),
+        "date": (date, "Helvetica"),
+        "time": (time, "Helvetica"),
+        "labnummer": (labnummer, "Helvetica"),
+        "qr_text": (qr_text, "Helvetica"),
+        **{f"rq{i}": (BOX_X if d in sel else BOX_EMPTY, "Courier") for i, d in enumerate(ALL_DIAGNOSES)},
+    }
+    if personnummer:
+        values["personnummer"] = (personnummer, "Helvetica")
+
+    subst = {_slot(k).encode(): _pdf_string(v, font) for k, (v, font) in values.items()}
+    if (None in subst.values() or any(c in qr_text for c in "<>&")
+            or stringWidth(qr_text, "Helvetica", 9) > QR_LABEL_MAX_WIDTH):
+        return generate_lab_form_bytes(
+            labnummer=labnummer, name=name, date=date, time=time, diagnoses=diagnoses,
+            qr_png=qr_png, personnummer=personnummer, hospital=hospital, qr_label=qr_label,
+        )
+
+    tpl = _template(hospital, bool(personnummer))
+    with fitz.open("pdf", tpl.pdf) as doc:
+        with stage("template_fill"):
+            for xref in tpl.content_xrefs:
+                doc.update_stream(xref, _SLOT_RE.sub(lambda m: subst[m.group(0)], doc.xref_stream(xref)))
+            _set_qr_image(doc, tpl.qr_xref, qr_png)
+            now = fitz.get_pdf_str(fitz.get_pdf_now())
+            info = info_xref(doc)
+            doc.xref_set_key(info, "CreationDate", now)
+            doc.xref_set_key(info, "ModDate", now)
+            write_layout(doc, form_layout(labnummer, sel, tpl.diag_tab, tpl.sign_tab))
+        with stage("tobytes"):
+            return doc.tobytes(deflate=True)
+
+
+def render_lab_forms(items: list[dict]) -> list[bytes]:
+    """
+    Render several requisitions (runs in a worker process for bulk printing).
+    Each item holds render_lab_form_bytes fields, with the QR payload under "qr"; the
+    "QR encodes:" line prints that payload unless the item sets its own qr_label.
+    """
+    pdfs = []
+    for item in items:
+        fields = {k: v for k, v in item.items() if k != "qr"}
+        fields.setdefault("qr_label", item["qr"])
+        pdfs.append(render_lab_form_bytes(qr_png=qr_png(item["qr"]), **fields))
+    return pdfs
@@ -6,54 +6,112 @@ Usage:
   # Generate for one labnummer
   python3 gen_barcode.py LAB-20250902-A6078222F0
 
-  # Generate for all labnumre in samples.csv
-  python3 gen_barcode.py --all
-
-Outputs:
-  - barcodes/<LAB>.png  (QR)           if 'qrcode' is available
-  - barcodes/<LAB>.svg  (Code128)      if 'python-barcode' is available
-  - barcodes/<LAB>.png  (Code128 PNG)  if 'python-barcode' + Pillow available
-  - barcodes/<LAB>.zpl  (ZPL fallback) if no libs installed
+  # Generate for all labnumre in samples.csv that are new or out of date
+  python3 gen_barcode.py --all [--since 2025-09-01] [--jobs N] [--force]
+
+  # Print labels as one ZPL job: to a Zebra's raw port, a spool file or stdout
+  python3 gen_barcode.py --print tcp://zebra-1:9100 LAB-20250902-A6078222F0 LAB-...
+  python3 gen_barcode.py --print rack.zpl --all --since 2025-09-01
+  python3 gen_barcode.py --print - --all | lp -d zebra -o raw
+
+Outputs (in barcodes/, sharded by date like the service's artifacts, see artifact_store.py):
+  - <LAB>.png  (QR)           if 'qrcode' is available
+  - <LAB>.svg  (Code128)      if 'python-barcode' is available
+  - <LAB>.png  (Code128 PNG)  if 'python-barcode' + Pillow available
+  - <LAB>.zpl  (ZPL fallback) if no libs installed
+
+--all is incremental: barcodes-manifest.json (next to samples.csv) keeps a hash of
+each label's payload + renderer. Labels whose hash matches and whose file exists are
+skipped; the rest are rendered across a process pool (--jobs, default one per CPU).
+--since DATE only considers samples dated DATE or later (nightly runs); --force
+renders every label again.
+
+--print writes no files: the labels' ZPL is generated lazily and written as one job
+in chunks of CHUNK_BYTES. On TCP the socket's flow control is the back-pressure: a
+busy printer stops reading, sendall blocks once SEND_BUFFER bytes are queued, and
+nothing more is generated. A printer that stalls for PRINT_TIMEOUT seconds fails the
+job. Spool files are written under a
+temporary name and renamed when complete. Try it with benchmarks/fake_printer.py.
 """
-import sys
+import argparse
 import csv
+import hashlib
+import json
+import os
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from contextlib import contextmanager
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+from urllib.parse import urlsplit
+
+from artifact_store import ArtifactStore
+from sample_store import normalise_header
 
 # ---- paths ----
 CSV_PATH = Path(__file__).with_name("samples.csv")
 OUT_DIR  = Path(__file__).with_name("barcodes")
-OUT_DIR.mkdir(exist_ok=True)
+MANIFEST_PATH = Path(__file__).with_name("barcodes-manifest.json")
+
+RENDER_VERSION = 1  # bump when the label output changes: every label is rendered again
+CHUNK = 64          # labels per pool task
+
+PRINTER_PORT  = 9100       # raw port of Zebra (and most network label) printers
+CHUNK_BYTES   = 32 * 1024  # ZPL per write when printing
+PRINT_TIMEOUT = 30.0       # seconds a printer may stop reading before the job fails
+SEND_BUFFER   = 64 * 1024  # job bytes the kernel may hold ahead of the printer
 
-def make_qr_png(data: str, filepath: Path) -> bool:
+store = ArtifactStore(OUT_DIR)
+
+# ---- renderers (libraries are imported once per process, on first use) ----
+@lru_cache(maxsize=None)
+def _qrcode():
     try:
         import qrcode  # type: ignore
-        img = qrcode.make(data)
-        img.save(filepath)
-        return True
-    except Exception:
-        return False
+        return qrcode
+    except ImportError:
+        return None
 
-def make_code128_svg_png(data: str, basepath: Path) -> bool:
+@lru_cache(maxsize=None)
+def _code128():
     try:
         from barcode import Code128  # type: ignore
         from barcode.writer import ImageWriter, SVGWriter  # type: ignore
+        return Code128, ImageWriter, SVGWriter
+    except ImportError:
+        return None
 
-        # SVG (crisp for printing)
-        svg_path = basepath.with_suffix(".svg")
-        with open(svg_path, "wb") as fsvg:
-            Code128(data, writer=SVGWriter()).write(fsvg)
+def make_qr_png(data: str) -> Optional[dict]:
+    qrcode = _qrcode()
+    if qrcode is None:
+        return None
+    buf = BytesIO()
+    qrcode.make(data).save(buf)
+    return {".png": buf.getvalue()}
 
-        # Try PNG (nice for preview / MS Word etc.)
-        ##
-        try:
-            png_path = basepath.with_suffix(".png")
-            with open(png_path, "wb") as fpng:
-                Code128(data, writer=ImageWriter()).write(fpng)
-        except Exception:
-            pass
-        return True
+def make_code128_svg_png(data: str) -> Optional[dict]:
+    libs = _code128()
+    if libs is None:
+        return None
+    Code128, ImageWriter, SVGWriter = libs
+
+    # SVG (crisp for printing)
+    svg = BytesIO()
+    Code128(data, writer=SVGWriter()).write(svg)
+    files = {".svg": svg.getvalue()}
+
+    # Try PNG (nice for preview / MS Word etc.)
+    try:
+        png = BytesIO()
+        Code128(data, writer=ImageWriter()).write(png)
+        files[".png"] = png.getvalue()
     except Exception:
-        return False
+        pass
+    return files
 
 def zpl_for_code128(data: str) -> str:
     # Simple ZPL: Code128 + human-readable text under
@@ -66,53 +124,215 @@ def zpl_for_code128(data: str) -> str:
 ^XZ
 """.strip()
 
-def write_zpl(data: str, basepath: Path):
-    zpl_path = basepath.with_suffix(".zpl")
-    zpl_path.write_text(zpl_for_code128(data), encoding="utf-8")
-    return zpl_path
+def make_zpl(data: str) -> dict:
+    return {".zpl": zpl_for_code128(data).encode("utf-8")}
+
+# kind -> (renderer, file checked by --all); tried in this order
+RENDERERS = {
+    "qr": (make_qr_png, ".png"),
+    "code128": (make_code128_svg_png, ".svg"),
+    "zpl": (make_zpl, ".zpl"),
+}
+
+def preferred_kind() -> str:
+    """The renderer a label gets when nothing fails."""
+    if _qrcode() is not None:
+        return "qr"
+    if _code128() is not None:
+        return "code128"
+    return "zpl"
+
+def label_hash(labnummer: str, kind: str) -> str:
+    return hashlib.sha256(f"{RENDER_VERSION}\0{kind}\0{labnummer}".encode("utf-8")).hexdigest()
+
+def render_label(labnummer: str) -> tuple:
+    """Render + store one label with the first renderer that works -> (labnummer, kind)."""
+    for kind, (render, _) in RENDERERS.items():
+        try:
+            files = render(labnummer)
+        except Exception:
+            files = None
+        if files:
+            for suffix, data in files.items():
+                store.put(labnummer + suffix, data)
+            return labnummer, kind
+    raise RuntimeError(f"no renderer worked for {labnummer}")
 
 def generate_for(labnummer: str):
-    base = OUT_DIR / labnummer
-    # 1) try QR PNG
-    if make_qr_png(labnummer, base.with_suffix(".png")):
-        print(f"✓ QR → {base.with_suffix('.png')}")
-        return
-    # 2) try Code128 SVG/PNG
-    if make_code128_svg_png(labnummer, base):
-        print(f"✓ Code128 → {base.with_suffix('.svg')} (and PNG if possible)")
-        return
-    # 3) fallback ZPL
-    zpl_path = write_zpl(labnummer, base)
-    print(f"✓ ZPL fallback → {zpl_path} (send to Zebra)")
+    _, kind = render_label(labnummer)
+    if kind == "qr":
+        print(f"✓ QR → {store.path(labnummer + '.png')}")
+    elif kind == "code128":
+        print(f"✓ Code128 → {store.path(labnummer + '.svg')} (and PNG if possible)")
+    else:
+        print(f"✓ ZPL fallback → {store.path(labnummer + '.zpl')} (send to Zebra)")
 
-def read_all_labnumre():
+# ---- --all ----
+def read_all_labnumre(since: Optional[str] = None):
+    """Distinct labnumre in file order; with `since` only samples dated `since` (YYYY-MM-DD) or later."""
     if not CSV_PATH.exists():
         print("⚠️  samples.csv not found — nothing to generate.")
         return []
-    labs = []
-    with CSV_PATH.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            lab = (row.get("labnummer") or "").strip()
-            if lab:
-                labs.append(lab)
-    return labs
+    labs = {}
+    with CSV_PATH.open("r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = normalise_header(next(reader, []))
+        if "labnummer" not in header:
+            return []
+        lab_i = header.index("labnummer")
+        date_i = header.index("date") if "date" in header else None
+        for rec in reader:
+            lab = rec[lab_i].strip() if len(rec) > lab_i else ""
+            if not lab:
+                continue
+            if since and (date_i is None or len(rec) <= date_i or rec[date_i].strip() < since):
+                continue
+            labs[lab] = None
+    return list(labs)
+
+def load_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(manifest: dict) -> None:
+    tmp = MANIFEST_PATH.with_name(f".{MANIFEST_PATH.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+def generate_all(since: Optional[str] = None, jobs: int = 0, force: bool = False) -> dict:
+    """Render the labels that are missing or out of date -> counts."""
+    labs = read_all_labnumre(since)
+    manifest = load_manifest()
+    kind = preferred_kind()
+    suffix = RENDERERS[kind][1]
+    todo = [
+        lab for lab in labs
+        if force or manifest.get(lab) != label_hash(lab, kind) or not store.exists(lab + suffix)
+    ]
+    counts = {"labels": len(labs), "upToDate": len(labs) - len(todo), "rendered": 0, "fallback": 0}
+
+    def record(done):
+        for lab, got in done:
+            manifest[lab] = label_hash(lab, got)
+            counts["rendered"] += 1
+            counts["fallback"] += got != kind  # re-rendered next run
+
+    jobs = jobs or os.cpu_count() or 1
+    try:
+        if jobs == 1 or len(todo) <= CHUNK:
+            record(map(render_label, todo))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                record(pool.map(render_label, todo, chunksize=CHUNK))
+    finally:
+        if todo:
+            save_manifest(manifest)  # progress is kept even if a run is interrupted
+    return counts
+
+# ---- --print ----
+def zpl_job(labnumre: Iterable[str]) -> Iterator[tuple]:
+    """One ZPL job for all labels, generated lazily -> (chunk of ~CHUNK_BYTES, labels in it)."""
+    parts, size = [], 0
+    for lab in labnumre:
+        if "^" in lab or "~" in lab:  # would end the field and start a ZPL command
+            print(f"⚠️  {lab!r} skipped: not printable as ZPL field data", file=sys.stderr)
+            continue
+        label = (zpl_for_code128(lab) + "\n").encode("utf-8")
+        parts.append(label)
+        size += len(label)
+        if size >= CHUNK_BYTES:
+            yield b"".join(parts), len(parts)
+            parts, size = [], 0
+    if parts:
+        yield b"".join(parts), len(parts)
+
+@contextmanager
+def open_printer(target: str) -> Iterator[Callable[[bytes], None]]:
+    """write(bytes) for `target`: tcp://HOST[:PORT] (raw port), "-" (stdout) or a spool file path."""
+    if target == "-":
+        out = sys.stdout.buffer
+
+        def write(data: bytes) -> None:
+            out.write(data)
+            out.flush()  # a full pipe blocks here
+
+        yield write
+    elif target.startswith("tcp://"):
+        url = urlsplit(target)
+        with socket.create_connection((url.hostname, url.port or PRINTER_PORT), timeout=PRINT_TIMEOUT) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+            yield sock.sendall
+            sock.shutdown(socket.SHUT_WR)  # end of job
+    else:
+        spool = Path(target)
+        tmp = spool.with_name(f".{spool.name}.{os.getpid()}.tmp")
+        try:
+            with tmp.open("wb") as f:
+                yield f.write
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, spool)  # a spooler never sees half a job
+        finally:
+            tmp.unlink(missing_ok=True)
+
+def print_labels(labnumre: Iterable[str], target: str, sent: Optional[dict] = None) -> dict:
+    """Send one ZPL job for `labnumre` to `target` -> counts (kept up to date in `sent`, if given)."""
+    sent = {"labels": 0, "bytes": 0} if sent is None else sent
+    with open_printer(target) as write:
+        for chunk, n in zpl_job(labnumre):
+            write(chunk)
+            sent["labels"] += n
+            sent["bytes"] += len(chunk)
+    return sent
+
+def iso_date(value: str) -> str:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {value!r}")
 
 def main():
-    if len(sys.argv) >= 2 and sys.argv[1] == "--all":
-        all_labs = read_all_labnumre()
-        if not all_labs:
+    ap = argparse.ArgumentParser(description="Generate barcode files for lab numbers from samples.csv.")
+    ap.add_argument("labnummer", nargs="*", help="generate (or print) for these labnumre only")
+    ap.add_argument("--all", action="store_true", help="every labnummer in samples.csv that is new or out of date")
+    ap.add_argument("--since", type=iso_date, metavar="DATE", help="with --all: only samples dated DATE or later")
+    ap.add_argument("--jobs", type=int, default=0, help="with --all: render processes (default: one per CPU)")
+    ap.add_argument("--force", action="store_true", help="with --all: render up-to-date labels again")
+    ap.add_argument("--print", dest="target", metavar="TARGET",
+                    help="print the labels as one ZPL job to tcp://HOST[:PORT], a spool file or - (stdout)")
+    args = ap.parse_args()
+
+    labs = [lab.strip() for lab in args.labnummer if lab.strip()]
+    if args.target:
+        if args.all:
+            labs = read_all_labnumre(args.since)
+        if not labs:
+            ap.error("--print needs labnumre or --all")
+        log = sys.stderr if args.target == "-" else sys.stdout  # keep stdout for the job itself
+        c = {"labels": 0, "bytes": 0}
+        try:
+            print_labels(labs, args.target, c)
+        except OSError as e:
+            sys.exit(f"⚠️  printing to {args.target} failed after {c['labels']} labels: {e}")
+        print(f"✓ {c['labels']} labels ({c['bytes']} bytes) → {args.target}", file=log)
+        return
+
+    if args.all:
+        c = generate_all(args.since, args.jobs, args.force)
+        if not c["labels"]:
             print("No lab numbers found in samples.csv.")
             return
-        for lab in all_labs:
-            generate_for(lab)
+        print(f"✓ {c['rendered']} rendered, {c['upToDate']} up to date ({c['labels']} labels) → {OUT_DIR}")
+        if c["fallback"]:
+            print(f"⚠️  {c['fallback']} labels fell back to a simpler format")
         return
 
-    if len(sys.argv) >= 2:
-        lab = sys.argv[1].strip()
-        if lab:
+    if labs:
+        for lab in labs:
             generate_for(lab)
-            return
+        return
 
     print(__doc__)
 
@@ -0,0 +1,146 @@
+# backEnd/DigLabAPI/PythonService/image_analysis.py
+"""
+Pen-mark analysis of raster scans (PNG / JPEG / TIFF) without wrapping them in a PDF.
+
+A raster scan has no text layer, so box positions come from the layout descriptor of
+the requisition the form was printed from (see form_layout.py). The labnummer comes
+from the caller or, failing that, from the form's QR code (see form_qr.py). The scan
+is assumed to be the full, upright page; page points are mapped to pixels by simple scaling.
+"""
+from __future__ import annotations
+
+import io
+from typing import Optional
+
+import fitz  # PyMuPDF – only to read the requisition's layout descriptor
+import numpy as np
+from PIL import Image, ImageOps
+
+from form_layout import requisition_layout, requisition_pdf
+from form_qr import parse_payload, scan_gray_qr
+from metrics import stage
+from pdf_analysis import (
+    DIAGNOSES, LABNUM_RE, DarkMask, classify_mark, compute_overall, pixel_union, tight_roi,
+)
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+ANALYSIS_DPI = 150  # plenty for pen strokes; decoding larger scans is downsampled to this
+A4_SIZE = fitz.paper_size("a4")  # page size assumed until the requisition is known
+
+
+def decode_gray(image_bytes: bytes, page_size: tuple[float, float] | None = None,
+                dpi: int = ANALYSIS_DPI) -> np.ndarray:
+    """
+    Decode straight to an 8-bit grayscale array, no larger than needed for `dpi`.
+    JPEG is downscaled inside the decoder (draft mode); other formats are
+    box-reduced by an integer factor after decoding.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if page_size is not None:
+        target = (int(page_size[0] * dpi / 72.0), int(page_size[1] * dpi / 72.0))
+        if img.format == "JPEG":
+            img.draft("L", target)
+        factor = min(img.width // max(target[0], 1), img.height // max(target[1], 1))
+    else:
+        factor = 1
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # Transparent pixels are paper, not ink
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    if img.mode != "L":
+        img = img.convert("L")
+    if factor >= 2:
+        img = img.reduce(factor)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def analyze_gray(gray: np.ndarray, layout: dict) -> dict[str, str]:
+    """Same ROI + classification as the PDF path, on a grayscale page image."""
+    page_w, page_h = layout["page_size"]
+    sx, sy = gray.shape[1] / page_w, gray.shape[0] / page_h
+    marks = {d: "none" for d in DIAGNOSES}
+
+    def pixels(r: fitz.Rect) -> Optional[tuple[int, int, int, int]]:
+        x0, y0 = max(int(r.x0 * sx), 0), max(int(r.y0 * sy), 0)
+        x1, y1 = min(int(r.x1 * sx), gray.shape[1]), min(int(r.y1 * sy), gray.shape[0])
+        return (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+
+    rows: dict[str, list] = {}
+    for d in DIAGNOSES:
+        row = layout["rows"].get(d)
+        if row and row.get("requested"):
+            rows[d] = [pixels(tight_roi(fitz.Rect(row["boxes"][k]))) for k in ("positive", "negative")]
+    boxes = [b for pair in rows.values() for b in pair]
+    live = [b for b in boxes if b is not None]
+    if not live:
+        return marks
+
+    with stage("roi_score"):
+        x0, y0, x1, y1 = pixel_union(live)
+        fractions = DarkMask(gray[y0:y1, x0:x1], (x0, y0)).fractions(boxes)
+        for i, d in enumerate(rows):
+            marks[d] = classify_mark(fractions[2 * i], fractions[2 * i + 1])
+    return marks
+
+
+def analyze_image(image_bytes: bytes, labnummer: Optional[str] = None, forms_dir: Optional[str] = None) -> dict:
+    """
+    /analyze pipeline for a raster scan (runs in a worker process); same result
+    shape as pdf_analysis.analyze_pdf. Without a known requisition every row is "none".
+    """
+    gray: Optional[np.ndarray] = None
+    qr_dx: Optional[list[str]] = None
+    if not labnummer:
+        with stage("image_decode"):
+            gray = decode_gray(image_bytes, A4_SIZE)
+        scan_dpi = gray.shape[1] * 72.0 / A4_SIZE[0]
+        qr_id, qr_dx = parse_payload(scan_gray_qr(gray, scan_dpi) or "", DIAGNOSES)
+        m = LABNUM_RE.fullmatch(qr_id.upper())
+        labnummer = m.group(0) if m else None
+
+    form_pdf = requisition_pdf(forms_dir, labnummer)
+    layout = requisition_layout(str(form_pdf) if form_pdf else None)
+    if layout is None:
+        if gray is None:
+            with Image.open(io.BytesIO(image_bytes)) as img:
+                img.verify()  # still reject uploads that aren't images
+        marks = {d: "none" for d in DIAGNOSES}
+        requested: set[str] = set(qr_dx or [])
+    else:
+        page_size = tuple(layout["page_size"])
+        if gray is None or any(abs(a - b) > 1 for a, b in zip(page_size, A4_SIZE)):
+            with stage("image_decode"):
+                gray = decode_gray(image_bytes, page_size)
+        marks = analyze_gray(gray, layout)
+        requested = {d for d, row in layout["rows"].items() if row.get("requested")}
+        labnummer = labnummer or layout.get("labnummer")
+
+    return {
+        "labnummer": labnummer,
+        "result": compute_overall(marks, requested_only=requested),
+        "found": {
+            "name": None, "personnummer": None, "date": None, "time": None,
+            "diagnoses": [d for d in DIAGNOSES if d in requested] or None,
+        },
+        "marks": marks,
+        "anchor": layout_anchor(layout),
+    }
+
+
+def layout_anchor(layout: Optional[dict]) -> Optional[dict]:
+    """Signature anchor for /finalize-form (see pdf_analysis.signature_anchor)."""
+    if layout is None or not layout.get("signature"):
+        return None
+    return {"page": 0, "y": layout["signature"]["y"], "page_size": layout["page_size"]}
+
+
+def image_scan_to_pdf(image_path: str, page_size: tuple[float, float] | None = None) -> fitz.Document:
+    """One-page PDF showing the scan full-page (used by /finalize-form to stamp on image scans)."""
+    w, h = page_size or fitz.paper_size("a4")
+    doc = fitz.open()
+    page = doc.new_page(width=w, height=h)
+    page.insert_image(page.rect, filename=image_path, keep_proportion=False)
+    return doc
@@ -5,37 +5,131 @@ Looks up labnummer -> prints personnummer, date, time from samples.csv.
 Usage:
   python3 lookup_lab.py LAB-YYYYMMDD-XXXXXXXXXX
   # or run without args and it will prompt
+
+  # Batch: many labnumre (one per line, or the first column of a CSV) from a file or stdin
+  python3 lookup_lab.py --batch rack.txt [--format csv|json] > result.csv
+  scanner-export | python3 lookup_lab.py --batch --format json
+  python3 lookup_lab.py LAB-... LAB-... LAB-...
+
+Batch lookups read samples.csv once, keep only the requested rows, and stop as soon
+as every labnummer is found. Output comes in input order: labnummer, found,
+personnummer, date, time, created_at. The exit code is 1 if any labnummer is
+missing. Both header schemas are read: the service's date/time and the legacy
+dato/klokke (see sample_store.py).
 """
-import sys, csv
+import argparse
+import csv
+import json
+import sys
 from pathlib import Path
 
+from sample_store import normalise_header
+
 CSV_PATH = Path(__file__).with_name("samples.csv")
+FIELDS = ["personnummer", "date", "time", "created_at"]
+
+def lookup_many(labnumre, csv_path: Path = CSV_PATH) -> dict:
+    """
+    LABNUMMER (upper case) -> first row registered under it, for every labnummer in
+    `labnumre` that exists; one pass over the CSV.
+    """
+    wanted = {lab.strip().upper() for lab in labnumre if lab.strip()}
+    found = {}
+    if not wanted or not csv_path.exists():
+        return found
+    with csv_path.open("r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = normalise_header(next(reader, []))
+        if "labnummer" not in header:
+            return found
+        lab_i = header.index("labnummer")
+        for rec in reader:
+            if len(rec) <= lab_i:
+                continue
+            lab = rec[lab_i].strip().upper()
+            if lab in wanted and lab not in found:
+                found[lab] = dict(zip(header, rec))
+                if len(found) == len(wanted):
+                    break
+    return found
 
-def lookup(labnummer: str):
-    if not CSV_PATH.exists():
+def lookup(labnummer: str, csv_path: Path = CSV_PATH):
+    if not csv_path.exists():
         print("⚠️  samples.csv finnes ikke ennå (ingen registreringer).")
         return
-    with CSV_PATH.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("labnummer","").strip().upper() == labnummer.strip().upper():
-                print("\n✅ Funnet")
-                print(f"  Labnummer    : {row['labnummer']}")
-                print(f"  Personnummer : {row['personnummer']}")
-                print(f"  Dato         : {row['dato']}")
-                print(f"  Klokke       : {row['klokke']}")
-                print(f"  Registrert   : {row.get('created_at','')}")
-                return
-    print("⚠️  Fant ikke dette labnummeret i samples.csv.")
+    row = lookup_many([labnummer], csv_path).get(labnummer.strip().upper())
+    if row is None:
+        print("⚠️  Fant ikke dette labnummeret i samples.csv.")
+        return
+    print("\n✅ Funnet")
+    print(f"  Labnummer    : {row['labnummer']}")
+    print(f"  Personnummer : {row.get('personnummer', '')}")
+    print(f"  Dato         : {row.get('date', '')}")
+    print(f"  Klokke       : {row.get('time', '')}")
+    print(f"  Registrert   : {row.get('created_at', '')}")
+
+# ---- batch ----
+def read_labnumre(stream):
+    """Labnumre from text: the first field of each non-empty line (a CSV header 'labnummer' is skipped)."""
+    labs = []
+    for line in stream:
+        first = line.split(",", 1)[0].strip().strip('"')
+        if first and not first.startswith("#") and first.lower() != "labnummer":
+            labs.append(first)
+    return labs
+
+def batch_results(labnumre, found: dict) -> list:
+    """One result per requested labnummer, in input order (duplicates kept)."""
+    results = []
+    for lab in labnumre:
+        row = found.get(lab.upper())
+        result = {"labnummer": row["labnummer"] if row else lab, "found": row is not None}
+        result.update({k: row.get(k) if row else None for k in FIELDS})
+        results.append(result)
+    return results
+
+def write_results(results: list, fmt: str, out=sys.stdout):
+    if fmt == "json":
+        json.dump(results, out, ensure_ascii=False, indent=1)
+        out.write("\n")
+        return
+    w = csv.DictWriter(out, fieldnames=["labnummer", "found", *FIELDS], lineterminator="\n")
+    w.writeheader()
+    w.writerows({**r, "found": "true" if r["found"] else "false"} for r in results)
 
 def main():
-    if len(sys.argv) >= 2:
-        labnr = sys.argv[1]
-    else:
-        labnr = input("Labnummer å slå opp: ").strip()
-        if not labnr:
-            print("Ingen labnummer oppgitt."); return
-    lookup(labnr)
+    ap = argparse.ArgumentParser(description="Look up labnumre in samples.csv.")
+    ap.add_argument("labnummer", nargs="*", help="one labnummer (printed), or several (batch output)")
+    ap.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                    help="read labnumre from FILE (default: stdin), one per line")
+    ap.add_argument("--format", choices=("csv", "json"), default="csv", help="batch output format (default csv)")
+    ap.add_argument("--samples", type=Path, default=CSV_PATH, help="samples.csv to search")
+    args = ap.parse_args()
+
+    if args.batch is None and len(args.labnummer) <= 1:
+        if args.labnummer:
+            labnr = args.labnummer[0]
+        else:
+            labnr = input("Labnummer å slå opp: ").strip()
+            if not labnr:
+                print("Ingen labnummer oppgitt."); return
+        lookup(labnr, args.samples)
+        return
+
+    labs = [lab.strip() for lab in args.labnummer if lab.strip()]
+    if args.batch == "-":
+        labs += read_labnumre(sys.stdin)
+    elif args.batch:
+        with open(args.batch, "r", encoding="utf-8-sig") as f:
+            labs += read_labnumre(f)
+    if not args.samples.exists():
+        print(f"⚠️  {args.samples} finnes ikke ennå (ingen registreringer).", file=sys.stderr)
+
+    results = batch_results(labs, lookup_many(labs, args.samples))
+    write_results(results, args.format)
+    missing = sum(not r["found"] for r in results)
+    print(f"✓ {len(results) - missing}/{len(results)} funnet", file=sys.stderr)
+    sys.exit(1 if missing else 0)
 
 if __name__ == "__main__":
     main()
@@ -3,34 +3,45 @@ from __future__ import annotations
 
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
-
-import csv
-import qrcode
-import re
+from typing import TYPE_CHECKING, List, Optional
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
 import uuid
+from collections import OrderedDict
 
-import fitz  # PyMuPDF
-import numpy as np
-from PIL import Image
-
-from fastapi import FastAPI, File, HTTPException, Query, UploadFile
-from fastapi.responses import FileResponse, Response
+from fastapi import BackgroundTasks, FastAPI, File, Form, Header, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 
-from pdf_form import generate_lab_form_pdf
+# PyMuPDF, NumPy, PIL, qrcode and ReportLab (pdf_analysis, image_analysis, form_qr,
+# form_template, form_layout) are imported inside the routes that need them, so
+# starting a worker doesn't load them; warm_up() preloads them (see warmup.py).
+from analysis_pool import AnalysisPool, PoolSaturated
+from artifact_store import ArtifactStore
+from form_cache import FormCache
+from metrics import CONTENT_TYPE, Counter, Gauge, HttpMetrics, render_metrics, stage
+from sample_store import SampleStore, decode_cursor, encode_cursor
+from warmup import STARTUP, mark, parse_steps, warm_up
+
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF, for annotations only
 
 
 # App
 
 app = FastAPI(title="DigLab PyService", version="1.2.0")
+app.add_middleware(HttpMetrics)  # request counts + latency per route for /metrics
 
 # Config / constants
 
-DIAGNOSES = ["Dengue", "Malaria", "TBE", "Hantavirus – Puumalavirus (PuV)"]
-LABNUM_RE = re.compile(r"LAB-\d{8}-[A-Z0-9]{8}")
-
-BASE_DIR = Path(__file__).parent
+BASE_DIR = Path(os.environ.get("DIGLAB_DATA_DIR") or Path(__file__).parent)  # samples.csv + artifact dirs
 
 CSV_PATH     = BASE_DIR / "samples.csv"
 BARCODES_DIR = BASE_DIR / "barcodes"
@@ -38,169 +49,189 @@ FORMS_DIR    = BASE_DIR / "forms"        # requisition PDFs from /generate-form
 RESULTS_DIR  = BASE_DIR / "formResults"  # finalized PDFs (stamped)
 SCANS_DIR    = BASE_DIR / "scans"        # uploaded/pen-marked PDFs from /analyze
 
-for d in (BARCODES_DIR, FORMS_DIR, RESULTS_DIR, SCANS_DIR):
-    d.mkdir(parents=True, exist_ok=True)
+# Files are sharded by the labnummer's date and deduplicated (see artifact_store.py).
+# Retention is per kind (0 = keep forever); cold files are gzipped, restored on read.
+COMPRESS_AFTER_DAYS = float(os.environ.get("DIGLAB_COMPRESS_AFTER_DAYS", "30"))
+STORAGE_MAINTENANCE_S = float(os.environ.get("DIGLAB_STORAGE_MAINTENANCE_S", "3600"))  # 0 = never
+
+def artifact_store(root: Path, kind: str) -> ArtifactStore:
+    return ArtifactStore(
+        root,
+        retention_days=float(os.environ.get(f"DIGLAB_{kind}_RETENTION_DAYS", "0")),
+        compress_after_days=COMPRESS_AFTER_DAYS,
+    )
+
+barcodes_store = artifact_store(BARCODES_DIR, "BARCODES")
+forms_store    = artifact_store(FORMS_DIR, "FORMS")
+results_store  = artifact_store(RESULTS_DIR, "RESULTS")
+scans_store    = artifact_store(SCANS_DIR, "SCANS")
+ARTIFACT_STORES = {"barcodes": barcodes_store, "forms": forms_store, "formResults": results_store, "scans": scans_store}
+_storage_report: dict = {}
+_storage_stop = threading.Event()
+
+samples = SampleStore(  # hash-indexed view of samples.csv, group-committed appends
+    CSV_PATH,
+    batch_size=int(os.environ.get("DIGLAB_REGISTER_BATCH", "256")),
+    batch_wait=float(os.environ.get("DIGLAB_REGISTER_WAIT_MS", "5")) / 1000.0,
+)
+
+SAMPLES_MAX_LIMIT = int(os.environ.get("DIGLAB_SAMPLES_MAX_LIMIT", "500"))  # page size cap for GET /samples
+
+# QR PNGs are rendered in memory; set to also keep barcodes/<labnummer>.png per generated form
+QR_EXPORT = os.environ.get("DIGLAB_QR_EXPORT", "0") == "1"
+
+# Rendered requisitions, keyed by request fields (ETag); forms/<lab>.pdf is written in the background
+form_cache = FormCache(max_bytes=int(os.environ.get("DIGLAB_FORM_CACHE_MB", "64")) * 1024 * 1024)
+FORMS_ON_DISK_SIZE = int(os.environ.get("DIGLAB_FORMS_ON_DISK_CACHE", "4096"))
+_forms_on_disk: "OrderedDict[str, str]" = OrderedDict()  # lab -> cache key of the form last written to forms/
+_forms_write_lock = threading.Lock()
+_forms_on_disk_lock = threading.Lock()  # the dict only: lookups never wait behind a write
+
+# Warm-up (see warmup.py): steps run in a background thread once the worker is ready, before
+# it reports ready with DIGLAB_WARMUP_SYNC=1, or at import with DIGLAB_PRELOAD=1 (pre-forking
+# servers); pool workers are spawned lazily unless DIGLAB_WARMUP_POOLS=1
+WARMUP_STEPS = parse_steps(os.environ.get("DIGLAB_WARMUP", "all"))
+PRELOAD = os.environ.get("DIGLAB_PRELOAD", "0") == "1"
+WARMUP_SYNC = os.environ.get("DIGLAB_WARMUP_SYNC", "0") == "1"
+WARMUP_POOLS = os.environ.get("DIGLAB_WARMUP_POOLS", "0") == "1"
+
+# Bulk printing (/generate-forms) renders chunks of pages in its own process pool
+render_pool = AnalysisPool(
+    workers=int(os.environ.get("DIGLAB_RENDER_WORKERS", "0")) or (os.cpu_count() or 1),
+    max_queue=int(os.environ.get("DIGLAB_RENDER_QUEUE", "16")),
+    warm=tuple(s for s in WARMUP_STEPS if s == "forms"),
+)
+BULK_MAX_FORMS = int(os.environ.get("DIGLAB_BULK_MAX_FORMS", "500"))
+BULK_CHUNK = int(os.environ.get("DIGLAB_BULK_CHUNK", "16"))  # forms per worker task
+
+# Signature anchors reported by /analyze, so /finalize-form needn't search the scan again
+ANCHOR_CACHE_SIZE = int(os.environ.get("DIGLAB_ANCHOR_CACHE", "4096"))
+_anchors: "OrderedDict[str, tuple[str, int, int, dict]]" = OrderedDict()  # lab -> (scan name, mtime_ns, size, anchor)
+_anchors_lock = threading.Lock()
+
+# Pen-mark rendering: "union" | "clip" (grayscale, ROI-only) or "full" (whole page, RGB)
+RENDER_MODE = os.environ.get("DIGLAB_RENDER_MODE", "union")
+
+analysis_pool = AnalysisPool(  # /analyze runs off the event loop in worker processes
+    workers=int(os.environ.get("DIGLAB_ANALYZE_WORKERS", "0")) or (os.cpu_count() or 1),
+    max_queue=int(os.environ.get("DIGLAB_ANALYZE_QUEUE", "8")),
+    retry_after=int(os.environ.get("DIGLAB_ANALYZE_RETRY_AFTER", "2")),
+    warm=tuple(s for s in WARMUP_STEPS if s in ("analysis", "images")),
+)
 
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
 def ensure_csv() -> None:
-    if not CSV_PATH.exists():
-        with CSV_PATH.open("w", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(["labnummer", "personnummer", "date", "time", "created_at"])
+    samples.ensure()
 
 def make_labnummer(date_iso: str) -> str:
     ymd = date_iso.replace("-", "")
     return f"LAB-{ymd}-{uuid.uuid4().hex[:8].upper()}"
 
 def append_csv(labnummer: str, personnummer: str, date_iso: str, time_hm: str) -> None:
-    ensure_csv()
-    with CSV_PATH.open("a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([labnummer, personnummer, date_iso, time_hm, datetime.utcnow().isoformat()])
+    samples.append([labnummer, personnummer, date_iso, time_hm, datetime.utcnow().isoformat()])
 
 def read_rows() -> list[dict]:
-    if not CSV_PATH.exists():
-        return []
-    with CSV_PATH.open("r", newline="", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
+    return samples.rows()
 
 def find_by_labnummer(lab: str) -> Optional[dict]:
-    lab = lab.strip().upper()
-    return next((r for r in read_rows() if r.get("labnummer", "").strip().upper() == lab), None)
+    return samples.get(lab)
 
 def find_by_personnummer(pp: str) -> Optional[dict]:
-    pp = pp.strip()
-    return next((r for r in read_rows() if r.get("personnummer", "").strip() == pp), None)
+    return samples.first_for_person(pp)
 
-def make_qr_png(data: str) -> Path:
-    out = BARCODES_DIR / f"{data}.png"
-    qrcode.make(data).save(out)
-    return out
-
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
-    parts: list[str] = []
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        for page in doc:
-            parts.append(page.get_text("text"))
-    return "\n".join(parts)
-
-def parse_fields_from_text(text: str) -> dict:
-    def grab(pat: str) -> Optional[str]:
-        m = re.search(pat, text, re.IGNORECASE)
-        return m.group(1).strip() if m else None
-
-    name = grab(r"Full Name:\s*(.+)")
-    pnr  = grab(r"Personnummer:\s*([0-9]{11})")
-    date = grab(r"Date:\s*([0-9]{4}-[0-9]{2}-[0-9]{2})")
-    time = grab(r"Time:\s*([0-9]{2}:[0-9]{2})")
-
-    found_dx: List[str] = []
-    for d in DIAGNOSES:
-        if re.search(rf"{re.escape(d)}\s*\[\s*X\s*\]", text, re.IGNORECASE):
-            found_dx.append(d)
-
-    return {"name": name, "personnummer": pnr, "date": date, "time": time, "diagnoses": found_dx or None}
-
-def compute_overall(marks: dict[str, str], requested_only: set[str] | None = None) -> str:
-    items = ((d, v) for d, v in marks.items() if requested_only is None or d in requested_only)
-    vals = [v for _, v in items]
-    has_pos = any(v == "positive" for v in vals)
-    has_neg = any(v == "negative" for v in vals)
-    if has_pos and not has_neg:
-        return "positive"
-    if has_neg and not has_pos:
-        return "negative"
-    if has_pos and has_neg:
-        return "mixed"
-    return "inconclusive"
-
-def analyze_pen_marks_from_pdf(pdf_bytes: bytes, requested_only: set[str] | None = None) -> dict[str, str]:
+def allocate_labnummers(reqs: List["GenerateFormRequest"]) -> list[str]:
     """
-    Detect pen marks near the Positive/Negative boxes per diagnosis.
-    Only evaluates rows in `requested_only` if provided.
+    Labnummer per request; missing ones are generated (unique against the registry)
+    and registered in one group commit.
     """
-    marks: dict[str, str] = {}
-
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        page = doc[0]
-
-        # Render WITH ink annotations
-        scale = 300 / 72.0
-        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False, annots=True)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-        def rect_to_px(r: fitz.Rect) -> tuple[int, int, int, int]:
-            return int(r.x0 * scale), int(r.y0 * scale), int(r.x1 * scale), int(r.y1 * scale)
-
-        def row_mid_y(r: fitz.Rect) -> float:
-            return 0.5 * (r.y0 + r.y1)
-
-        # Tokens used in the form for empty/checked boxes
-        token_candidates = ("[    ]", "[   ]", "[  ]", "[ ]", "[X]", "[x]")
-        box_rects: list[fitz.Rect] = []
-        for token in token_candidates:
-            box_rects += page.search_for(token)
-
-        # ROI and threshold knobs (units: PDF points unless otherwise stated)
-        row_tol   = 12.0
-        pad_x     = 4.0
-        pad_y     = 6.0
-        widen_mul = 1.25
-        dark_thr  = 0.08
-        ratio_win = 1.25
-
-        def tight_roi(box: fitz.Rect) -> fitz.Rect:
-            w = box.width * widen_mul
-            cx = 0.5 * (box.x0 + box.x1)
-            x0, x1 = cx - 0.5 * w, cx + 0.5 * w
-            y0, y1 = box.y0 - pad_y, box.y1 + pad_y
-            return fitz.Rect(x0 - pad_x, y0, x1 + pad_x, y1)
-
-        def dark_fraction(r: fitz.Rect) -> float:
-            x0, y0, x1, y1 = rect_to_px(r)
-            x0 = max(x0, 0); y0 = max(y0, 0)
-            x1 = min(x1, img.width); y1 = min(y1, img.height)
-            if x1 <= x0 or y1 <= y0:
-                return 0.0
-            gray = img.crop((x0, y0, x1, y1)).convert("L")
-            arr  = np.asarray(gray, dtype=np.uint8)
-            return (arr < 200).mean()
-
-        for d in DIAGNOSES:
-            if requested_only is not None and d not in requested_only:
-                marks[d] = "none"
-                continue
-
-            hits = page.search_for(d)
-            if not hits:
-                marks[d] = "none"
-                continue
-
-            cy = row_mid_y(hits[0])
-            row_boxes = [r for r in box_rects if abs(row_mid_y(r) - cy) <= row_tol]
-            if len(row_boxes) < 3:
-                marks[d] = "none"
-                continue
-
-            # Choose the 3 most aligned; left->right = [Requested, Positive, Negative]
-            row_boxes.sort(key=lambda r: abs(row_mid_y(r) - cy))
-            row_boxes = row_boxes[:3]
-            row_boxes.sort(key=lambda r: r.x0)
-            _, pos_box, neg_box = row_boxes
-
-            df_pos = dark_fraction(tight_roi(pos_box))
-            df_neg = dark_fraction(tight_roi(neg_box))
-
-            if df_pos < dark_thr and df_neg < dark_thr:
-                marks[d] = "none"
-            elif df_pos >= df_neg * ratio_win:
-                marks[d] = "positive"
-            elif df_neg >= df_pos * ratio_win:
-                marks[d] = "negative"
-            else:
-                marks[d] = "positive" if df_pos >= df_neg else "negative"
+    labs: list[str] = []
+    new_rows: list[list[str]] = []
+    taken: set[str] = set()
+    now = datetime.utcnow().isoformat()
+    for req in reqs:
+        lab = req.labnummer
+        if not lab:
+            lab = make_labnummer(req.date)
+            while lab in taken or samples.get(lab):
+                lab = make_labnummer(req.date)
+            new_rows.append([lab, req.personnummer or "", req.date, req.time, now])
+        taken.add(lab)
+        labs.append(lab)
+    if new_rows:
+        samples.append_many(new_rows)
+    return labs
+
+def form_name(lab: str) -> str:
+    return f"{lab}.pdf"
+
+def persist_form(lab: str, pdf: bytes, key: str) -> None:
+    """Store a generated form (atomic: readers never see a partial file)."""
+    with _forms_write_lock:
+        forms_store.put(form_name(lab), pdf)
+        with _forms_on_disk_lock:
+            _forms_on_disk.pop(lab, None)
+            _forms_on_disk[lab] = key
+            while len(_forms_on_disk) > FORMS_ON_DISK_SIZE:
+                _forms_on_disk.popitem(last=False)  # forgotten forms are just written again (deduplicated)
+
+def form_on_disk(lab: str, key: str) -> bool:
+    with _forms_on_disk_lock:
+        if _forms_on_disk.get(lab) != key:
+            return False
+        _forms_on_disk.move_to_end(lab)
+    return forms_store.exists(form_name(lab))
+
+def export_qr_png(png: bytes, name: str) -> Path:
+    return barcodes_store.put(f"{name}.png", png)
+
+def maintain_storage() -> None:
+    """
+    Background loop: migrate / compress / prune the artifact stores (see artifact_store.py).
+    The first pass runs at startup, so /metrics has directory sizes straight away.
+    """
+    while True:
+        for kind, store in ARTIFACT_STORES.items():
+            try:
+                _storage_report[kind] = {"at": datetime.utcnow().isoformat(), **store.maintain()}
+            except Exception as e:  # keep serving; report it on /health
+                _storage_report[kind] = {**_storage_report.get(kind, {}),
+                                         "at": datetime.utcnow().isoformat(), "error": str(e)}
+        if _storage_stop.wait(STORAGE_MAINTENANCE_S):
+            return
+
+# /metrics: values read at scrape time from the pools, the form cache and the last storage pass
+POOLS = {"analyze": analysis_pool, "render": render_pool}
+
+def pool_tasks() -> dict:
+    out = {}
+    for name, pool in POOLS.items():
+        st = pool.stats()
+        out[(name, "running")], out[(name, "queued")] = st["running"], st["queued"]
+    return out
 
-    return marks
+def form_cache_requests() -> dict:
+    st = form_cache.stats()
+    return {("hit",): st["hits"], ("miss",): st["misses"]}
+
+def artifact_stat(key: str) -> dict:
+    return {(kind,): r[key] for kind, r in _storage_report.items() if key in r}
+
+Gauge("diglab_pool_tasks", "Tasks in a worker pool", ("pool", "state"), read=pool_tasks)
+Counter("diglab_pool_rejected_total", "Tasks refused with 503 (pool saturated)", ("pool",),
+        read=lambda: {(name,): pool.stats()["rejected"] for name, pool in POOLS.items()})
+Gauge("diglab_form_cache_bytes", "Rendered forms held in memory", read=lambda: {(): form_cache.stats()["bytes"]})
+Counter("diglab_form_cache_requests_total", "Form cache lookups", ("result",), read=form_cache_requests)
+Gauge("diglab_artifact_files", "Stored artifacts per kind (last storage pass)", ("kind",),
+      read=lambda: artifact_stat("files"))
+Gauge("diglab_artifact_bytes", "Bytes on disk per artifact kind (last storage pass)", ("kind",),
+      read=lambda: artifact_stat("bytes"))
+Gauge("diglab_startup_seconds", "Process age when imported / ready, and time per warm-up step", ("phase",),
+      read=lambda: {
+          **{(p,): STARTUP[p] for p in ("imported", "ready") if STARTUP.get(p) is not None},
+          **{(f"warmup_{k}",): v for k, v in STARTUP["warmup"].items()},
+      })
 
 # -----------------------------------------------------------------------------
 # Schemas
@@ -242,18 +273,70 @@ def root():
         "service": "DigLab PyService",
         "endpoints": [
             "/health",
+            "/metrics",
             "/register",
             "/barcode",
             "/lookup",
+            "/samples",
             "/generate-form",
+            "/generate-forms",
             "/analyze",
+            "/analyze-batch",
             "/finalize-form",
         ],
     }
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "time": datetime.utcnow().isoformat()}
+    return {
+        "status": "ok",
+        "time": datetime.utcnow().isoformat(),
+        "analyze": analysis_pool.stats(),
+        "render": render_pool.stats(),
+        "formCache": form_cache.stats(),
+        "storage": _storage_report,
+        "startup": STARTUP,
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+def warm_service() -> None:
+    """Warm-up steps (unless preloaded), then the pool workers with DIGLAB_WARMUP_POOLS=1."""
+    try:
+        if not PRELOAD:
+            warm_up(WARMUP_STEPS)
+        if WARMUP_POOLS and WARMUP_STEPS:
+            for name, pool in POOLS.items():
+                t0 = time.perf_counter()
+                pool.start()
+                STARTUP["warmup"][f"{name}Pool"] = round(time.perf_counter() - t0, 4)
+    except Exception:
+        logging.getLogger("uvicorn.error").exception("DigLab warm-up failed")
+
+@app.on_event("startup")
+def startup():
+    if STORAGE_MAINTENANCE_S > 0:
+        threading.Thread(target=maintain_storage, name="storage-maintenance", daemon=True).start()
+    if WARMUP_SYNC:
+        warm_service()
+    mark("ready")
+    logging.getLogger("uvicorn.error").info(
+        "DigLab ready %.2fs after process start (imported at %.2fs, warm-up %s)",
+        STARTUP["ready"] or 0.0, STARTUP["imported"] or 0.0,
+        STARTUP["warmup"] if WARMUP_SYNC else "in background",
+    )
+    if not WARMUP_SYNC:
+        # Requests are served meanwhile; one that needs a library still being imported waits for it
+        threading.Thread(target=warm_service, name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown():
+    _storage_stop.set()
+    samples.close()  # flush queued registrations
+    analysis_pool.shutdown()
+    render_pool.shutdown()
 
 @app.post("/register")
 def register(req: RegisterRequest):
@@ -271,6 +354,8 @@ def register(req: RegisterRequest):
 
 @app.post("/barcode")
 def barcode(req: BarcodeRequest):
+    from form_qr import qr_png
+
     if req.personnummer:
         payload = req.personnummer
     elif req.labnummer:
@@ -280,7 +365,7 @@ def barcode(req: BarcodeRequest):
             raise HTTPException(status_code=400, detail="Provide personnummer or labnummer or date")
         payload = make_labnummer(req.date)
 
-    png_path = make_qr_png(payload)
+    png_path = export_qr_png(qr_png(payload), payload)  # explicit export: this endpoint exists to write the file
     return {"qr_data": payload, "png": str(png_path)}
 
 @app.get("/lookup")
@@ -297,71 +382,348 @@ def lookup(labnummer: Optional[str] = Query(None), personnummer: Optional[str] =
 
     return row
 
-@app.post("/generate-form")
-def generate_form(req: GenerateFormRequest):
+@app.get("/samples")
+def list_samples(
+    personnummer: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(50, ge=1, le=SAMPLES_MAX_LIMIT),
+    cursor: Optional[str] = Query(None),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+):
+    """
+    Samples of one person (or all) registered from..to (YYYY-MM-DD, inclusive), by date
+    and time. Pass `nextCursor` back as `cursor` for the next page (same other parameters).
+    """
+    try:
+        for d in (date_from, date_to):
+            if d:
+                datetime.strptime(d, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format (from/to: YYYY-MM-DD)")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows, total, last = samples.query(
+        personnummer, date_from, date_to, limit=limit, after=after, descending=order == "desc",
+    )
+    return {"samples": rows, "total": total, "nextCursor": encode_cursor(last) if last else None}
+
+def check_date_time(req: GenerateFormRequest) -> None:
     try:
         datetime.strptime(req.date, "%Y-%m-%d")
         datetime.strptime(req.time, "%H:%M")
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date/time format")
 
-    labnummer = req.labnummer or make_labnummer(req.date)
+def form_job(req: GenerateFormRequest, labnummer: str) -> tuple[str, dict]:
+    """Cache key + render fields (see form_template.render_lab_forms) for one requisition."""
+    from form_qr import encode_payload
+    from pdf_analysis import DIAGNOSES
+
     qr_payload = (req.qr_data or labnummer).strip()
-    qr_png = make_qr_png(qr_payload)
-
-    pdf_path = FORMS_DIR / f"{labnummer}.pdf"
-    generate_lab_form_pdf(
-        out_pdf=pdf_path,
-        labnummer=labnummer,
-        name=req.name,
-        date=req.date,
-        time=req.time,
-        diagnoses=req.diagnoses,
-        qr_png=qr_png,
-        personnummer=req.personnummer,
-    )
-    return FileResponse(pdf_path, media_type="application/pdf", filename=pdf_path.name)
+    if qr_payload == labnummer:
+        # Carry the requested diagnoses too, so text-less scans are identified from the QR alone
+        qr_payload = encode_payload(labnummer, req.diagnoses, DIAGNOSES)
+    fields = {
+        "labnummer": labnummer, "name": req.name, "date": req.date, "time": req.time,
+        "diagnoses": sorted(set(req.diagnoses)), "personnummer": req.personnummer, "qr": qr_payload,
+    }
+    return FormCache.key(**fields), fields
 
-@app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
-    if not file:
-        raise HTTPException(status_code=400, detail="No file uploaded")
+def persist_forms(forms: list[tuple[str, bytes, str]]) -> None:
+    for lab, pdf, key in forms:
+        if not form_on_disk(lab, key):
+            persist_form(lab, pdf, key)
 
-    content = await file.read()
+@app.post("/generate-form")
+def generate_form(
+    req: GenerateFormRequest,
+    background: BackgroundTasks,
+    if_none_match: Optional[str] = Header(None),
+):
+    from form_qr import qr_png
+    from form_template import render_lab_forms
+
+    check_date_time(req)
+    labnummer = req.labnummer or make_labnummer(req.date)
+
+    # Same fields -> same form: 304 if the client has it (before any rendering or I/O, so a
+    # worker that never rendered it answers just as cheaply), else serve it from memory
+    key, fields = form_job(req, labnummer)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    pdf = form_cache.get(key)
+    if pdf is None:
+        if QR_EXPORT:
+            export_qr_png(qr_png(fields["qr"]), labnummer)
+        pdf = render_lab_forms([fields])[0]
+        form_cache.put(key, pdf)
+
+    # /analyze and /finalize-form read the requisition from forms/
+    if not form_on_disk(labnummer, key):
+        background.add_task(persist_form, labnummer, pdf, key)
+
+    headers["Content-Disposition"] = f'attachment; filename="{form_name(labnummer)}"'
+    return Response(pdf, media_type="application/pdf", headers=headers)
+
+@app.post("/generate-forms")
+async def generate_forms(reqs: List[GenerateFormRequest], background: BackgroundTasks):
+    """
+    Bulk printing: one multi-page PDF (one requisition per page, in request order).
+    Missing labnummers are allocated + registered in one batch; pages not in the form
+    cache are rendered in chunks across the render pool and merged as they complete.
+    """
+    import fitz  # PyMuPDF
+
+    from form_template import render_lab_forms
+
+    if not reqs:
+        raise HTTPException(status_code=400, detail="No forms requested")
+    if len(reqs) > BULK_MAX_FORMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_FORMS} forms per request")
+    for req in reqs:
+        check_date_time(req)
+
+    labs = await run_in_threadpool(allocate_labnummers, reqs)
+    jobs = [form_job(req, lab) for req, lab in zip(reqs, labs)]
+    pages: list[Optional[bytes]] = [form_cache.get(key) for key, _ in jobs]
+
+    missing = [i for i, pdf in enumerate(pages) if pdf is None]
+    chunks = [missing[i:i + BULK_CHUNK] for i in range(0, len(missing), BULK_CHUNK)]
+
+    async def render(idx: list[int]) -> list[int]:
+        rendered = await render_pool.submit_when_ready(render_lab_forms, [jobs[i][1] for i in idx])
+        for i, pdf in zip(idx, rendered):
+            pages[i] = pdf
+            form_cache.put(jobs[i][0], pdf)
+        return idx
+
+    merged = fitz.open()
+    merged_upto = 0
+
+    def merge_ready(upto: int) -> None:
+        for i in range(merged_upto, upto):
+            with fitz.open("pdf", pages[i]) as page_doc:
+                merged.insert_pdf(page_doc)
+
+    tasks = [asyncio.create_task(render(idx)) for idx in chunks]
+    try:
+        # Append pages in order while later chunks are still rendering
+        for fut in [None, *asyncio.as_completed(tasks)]:
+            if fut is not None:
+                await fut
+            upto = merged_upto
+            while upto < len(pages) and pages[upto] is not None:
+                upto += 1
+            if upto > merged_upto:
+                await run_in_threadpool(merge_ready, upto)
+                merged_upto = upto
+        with stage("tobytes"):
+            pdf = await run_in_threadpool(merged.tobytes, garbage=3, deflate=True)
+    finally:
+        for t in tasks:
+            t.cancel()
+        merged.close()
+
+    background.add_task(persist_forms, [(lab, pages[i], jobs[i][0]) for i, lab in enumerate(labs)])
+    name = f"requisitions-{reqs[0].date}-{len(reqs)}.pdf"
+    return Response(pdf, media_type="application/pdf", headers={
+        "Content-Disposition": f'attachment; filename="{name}"',
+        "X-Labnummers": ",".join(labs),
+    })
+
+IMAGE_SUFFIX = {"image/png": ".png", "image/jpeg": ".jpg", "image/jpg": ".jpg", "image/tiff": ".tif"}
+
+def is_pdf_upload(file: UploadFile) -> bool:
     ctype = (file.content_type or "").lower()
-    if not ("pdf" in ctype or file.filename.lower().endswith(".pdf")):
-        raise HTTPException(status_code=415, detail=f"Unsupported content type: {ctype}")
+    return "pdf" in ctype or (file.filename or "").lower().endswith(".pdf")
+
+def image_suffix(file: UploadFile) -> Optional[str]:
+    """File suffix for a supported raster upload, else None."""
+    from image_analysis import IMAGE_EXTS
+
+    ext = Path(file.filename or "").suffix.lower()
+    if ext in IMAGE_EXTS:
+        return ext
+    return IMAGE_SUFFIX.get((file.content_type or "").lower())
 
-    # Extract text to find labnummer & requested diagnoses
-    text = extract_text_from_pdf_bytes(content)
+def requisition_path(lab: str) -> Optional[Path]:
+    from form_layout import requisition_pdf
 
-    labnummer = None
-    m = LABNUM_RE.search(text)
-    if m:
-        labnummer = m.group(0)
-        # Save the *original scanned* PDF – we’ll stamp on this in /finalize-form
-        (SCANS_DIR / f"{labnummer}.pdf").write_bytes(content)
+    return requisition_pdf(forms_store, lab)
+
+def latest_scan(lab: str) -> Optional[Path]:
+    from image_analysis import IMAGE_EXTS
+
+    scans = [p for p in (scans_store.locate(f"{lab}{ext}") for ext in (".pdf",) + IMAGE_EXTS) if p]
+    return max(scans, key=lambda p: p.stat().st_mtime, default=None)
+
+def anchor_name(lab: str) -> str:
+    return f"{lab}.anchor.json"
+
+def remember_anchor(lab: str, scan_path: Path, anchor: Optional[dict]) -> None:
+    """
+    Keep the anchor of exactly this scan file: in memory, and next to the scan so a
+    /finalize-form served by another worker / replica finds it too.
+    """
+    entry = None
+    if anchor is not None:
+        st = scan_path.stat()
+        entry = (scan_path.name, st.st_mtime_ns, st.st_size, anchor)
+        scans_store.put(anchor_name(lab), json.dumps(entry).encode())
+    else:
+        scans_store.delete(anchor_name(lab))
+    with _anchors_lock:
+        _anchors.pop(lab, None)
+        if entry is None:
+            return
+        _anchors[lab] = entry
+        while len(_anchors) > ANCHOR_CACHE_SIZE:
+            _anchors.popitem(last=False)
+
+def stored_anchor(lab: str) -> Optional[tuple]:
+    raw = scans_store.read(anchor_name(lab))
+    try:
+        return tuple(json.loads(raw)) if raw else None
+    except ValueError:
+        return None
 
-    found = parse_fields_from_text(text)
-    requested: set[str] = set(found.get("diagnoses") or [])  # ONLY requested rows count
+def cached_anchor(lab: str, src: Path) -> Optional[dict]:
+    """Anchor remembered for exactly this (unchanged) scan file, else None."""
+    try:
+        st = src.stat()
+    except FileNotFoundError:
+        return None
 
-    # Detect pen marks ONLY in requested rows
-    pen = analyze_pen_marks_from_pdf(content, requested_only=requested)
+    def matches(entry: Optional[tuple]) -> bool:
+        return entry is not None and entry[:3] == (src.name, st.st_mtime_ns, st.st_size)
 
-    # Build marks for all rows (unrequested -> "none")
-    marks = {d: (pen.get(d, "none") if d in requested else "none") for d in DIAGNOSES}
+    with _anchors_lock:
+        entry = _anchors.get(lab)
+    if not matches(entry):
+        entry = stored_anchor(lab)  # analysed by another process
+    return entry[3] if matches(entry) else None
 
-    overall = compute_overall(marks, requested_only=requested)
+def scan_response(res: dict, scan: bytes, suffix: str = ".pdf") -> dict:
+    labnummer = res["labnummer"]
+    if labnummer:
+        # Save the *original scan* – we’ll stamp on this in /finalize-form
+        scan_path = scans_store.put(f"{labnummer}{suffix}", scan)
+        remember_anchor(labnummer, scan_path, res.get("anchor"))
 
     return {
         "labnummer": labnummer,
-        "result": overall,
+        "result": res["result"],
         "confidence": 0.0,
-        "found": found,
-        "marks": marks,
-        "scanSaved": bool(labnummer and (SCANS_DIR / f"{labnummer}.pdf").exists()),
+        "found": res["found"],
+        "marks": res["marks"],
+        "scanSaved": bool(labnummer and scans_store.exists(f"{labnummer}{suffix}")),
     }
 
+@app.post("/analyze")
+async def analyze(file: UploadFile = File(...), labNumber: Optional[str] = Form(None)):
+    """
+    Analyse one scanned form: a PDF, or a PNG/JPEG/TIFF image.
+    Images have no text layer: the requisition is found via `labNumber` or the form's QR code.
+    """
+    from PIL import UnidentifiedImageError
+
+    from image_analysis import analyze_image
+    from pdf_analysis import LABNUM_RE, analyze_pdf
+
+    if not file:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    # Names the requisition to read and the scan to save: only a real labnummer
+    lab = (labNumber or "").strip().upper() or None
+    if lab is not None and not LABNUM_RE.fullmatch(lab):
+        raise HTTPException(status_code=400, detail="labNumber must look like LAB-YYYYMMDD-XXXXXXXX")
+
+    content = await file.read()
+    ctype = (file.content_type or "").lower()
+    suffix = ".pdf" if is_pdf_upload(file) else image_suffix(file)
+    if suffix is None:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {ctype}")
+
+    try:
+        if suffix == ".pdf":
+            res = await analysis_pool.submit(analyze_pdf, content, RENDER_MODE, str(FORMS_DIR))
+        else:
+            res = await analysis_pool.submit(analyze_image, content, lab, str(FORMS_DIR))
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, try again shortly",
+            headers={"Retry-After": str(analysis_pool.retry_after)},
+        )
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+
+    # Blocking store writes (hash, fsync, lock) run off the event loop
+    return await run_in_threadpool(scan_response, res, content, suffix)
+
+@app.post("/analyze-batch")
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """
+    Analyse several forms in one request: any mix of single-form PDFs and
+    multi-page PDFs with one form per page. Forms run in parallel on the analysis
+    pool and one NDJSON line is streamed per form as soon as it finishes.
+    Every line carries index/file/page; a failed form gets "error" instead of a result
+    and does not abort the rest of the batch.
+    """
+    from pdf_analysis import analyze_pdf, analyze_pdf_page, count_pages
+
+    async def run(meta: dict, content: bytes, page: Optional[int]) -> dict:
+        try:
+            if page is None:
+                res = await analysis_pool.submit_when_ready(analyze_pdf, content, RENDER_MODE, str(FORMS_DIR))
+                scan_pdf = content
+            else:
+                res = await analysis_pool.submit_when_ready(analyze_pdf_page, content, page, RENDER_MODE, str(FORMS_DIR))
+                scan_pdf = res.pop("pdf")
+            return {**meta, **await run_in_threadpool(scan_response, res, scan_pdf)}
+        except Exception as e:
+            return {**meta, "error": str(e) or type(e).__name__}
+
+    async def failed(meta: dict, error: str) -> dict:
+        return {**meta, "error": error}
+
+    jobs = []
+    for i, f in enumerate(files):
+        name = f.filename or f"file{i}"
+        content = await f.read()
+        if not is_pdf_upload(f):
+            jobs.append(failed({"index": len(jobs), "file": name, "page": None},
+                               f"Unsupported content type: {(f.content_type or '').lower()}"))
+            continue
+        try:
+            pages = await run_in_threadpool(count_pages, content)
+        except Exception as e:
+            jobs.append(failed({"index": len(jobs), "file": name, "page": None}, f"Unreadable PDF: {e}"))
+            continue
+        if pages == 1:
+            jobs.append(run({"index": len(jobs), "file": name, "page": 0}, content, None))
+        else:
+            for p in range(pages):
+                jobs.append(run({"index": len(jobs), "file": name, "page": p}, content, p))
+
+    tasks = [asyncio.ensure_future(j) for j in jobs]
+
+    async def stream():
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield json.dumps(await fut, ensure_ascii=False) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()  # client went away
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 
 
 def _find_signature_anchor(doc: fitz.Document) -> tuple[int, float | None]:
@@ -395,20 +757,72 @@ def finalize_form(payload: FinalizePayload):
     Stamp FINAL RESULTS on the scanned PDF (preferred) or the requisition.
     Text is red + bold-ish and placed ~3 px below the signature table.
     """
+    import fitz  # PyMuPDF
+
+    from form_layout import requisition_layout
+    from image_analysis import image_scan_to_pdf, layout_anchor
+
     lab = payload.labnummer.strip()
 
-    # Prefer pen-marked scan; fall back to requisition
-    src = SCANS_DIR / f"{lab}.pdf"
-    if not src.exists():
-        candidates = [FORMS_DIR / f"{lab}.pdf", FORMS_DIR / f"DigLab-{lab}.pdf"]
-        src = next((p for p in candidates if p.exists()), None)
-        if not src:
-            raise HTTPException(status_code=404, detail=f"Source PDF not found for {lab}")
+    # Prefer pen-marked scan (newest PDF or image); fall back to requisition
+    form = requisition_path(lab)
+    src = latest_scan(lab) or form
+    if not src:
+        raise HTTPException(status_code=404, detail=f"Source PDF not found for {lab}")
+
+    tmp = results_store.temp_path(".pdf")
+    anchor = cached_anchor(lab, src)  # from /analyze of this very scan
+    try:
+        if src.suffix.lower() == ".pdf":
+            # Stamp a copy; the stamp is appended as an incremental update
+            shutil.copyfile(src, tmp)
+            doc = fitz.open(tmp)
+        else:
+            # Image scan: stamp on a page-sized copy, positioned by the requisition's layout
+            if anchor is None and form:
+                anchor = layout_anchor(requisition_layout(str(form)))
+            doc = image_scan_to_pdf(str(src), tuple(anchor["page_size"]) if anchor else None)
+        try:
+            out_bytes = _stamp_results(doc, anchor, payload.results)
+        finally:
+            doc.close()
+        if out_bytes is None:
+            out_bytes = tmp.read_bytes()
+        else:
+            tmp.write_bytes(out_bytes)
+        # optional local copy (backend also saves returned bytes)
+        results_store.put_file(f"DigLab-{lab}-results.pdf", tmp)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+    return Response(content=out_bytes, media_type="application/pdf")
+
+def _anchor_fits(doc: fitz.Document, anchor: Optional[dict]) -> bool:
+    if anchor is None or anchor["page"] >= len(doc):
+        return False
+    r = doc[anchor["page"]].rect
+    w, h = anchor["page_size"]
+    return abs(r.width - w) <= 0.5 and abs(r.height - h) <= 0.5
 
-    doc = fitz.open(src)
+def _stamp_results(doc: fitz.Document, anchor: Optional[dict], results: List[FinalizeRow]) -> Optional[bytes]:
+    """
+    Draw FINAL RESULTS below the signature block. Saves file-backed documents
+    incrementally (returns None); returns the bytes of in-memory ones.
+    """
+    import fitz  # PyMuPDF
+
+    from form_layout import read_layout
 
-    # --- find signature anchor (page + bottom Y of the signatures block)
-    page_idx, anchor_y = _find_signature_anchor(doc)
+    # --- signature anchor (page + bottom Y of the signatures block): cached from /analyze,
+    #     else the layout descriptor of DigLab-generated PDFs, else a text search
+    if _anchor_fits(doc, anchor):
+        page_idx, anchor_y = anchor["page"], anchor["y"]
+    else:
+        layout = read_layout(doc)
+        if layout is not None and layout.get("signature"):
+            page_idx, anchor_y = layout["signature"]["page"], layout["signature"]["y"]
+        else:
+            page_idx, anchor_y = _find_signature_anchor(doc)
     page = doc[page_idx]
 
     # Layout
@@ -421,7 +835,7 @@ def finalize_form(payload: FinalizePayload):
     row_size    = 13
 
     # total block height (header + rows + small padding)
-    block_h = 28 + len(payload.results) * line + 10
+    block_h = 28 + len(results) * line + 10
 
     # starting y
     if anchor_y is not None:
@@ -451,14 +865,15 @@ def finalize_form(payload: FinalizePayload):
     draw_red_bold(left, y, "FINAL RESULTS", header_size)
     y += line + 6
 
-    for r in sorted(payload.results, key=lambda r: r.diagnosis.lower()):
+    for r in sorted(results, key=lambda r: r.diagnosis.lower()):
         draw_red_bold(left, y, f"{r.diagnosis}: {r.final}", row_size)
         y += line
 
-    out_bytes = doc.tobytes()
-    doc.close()
-
-    # optional local copy (backend also saves returned bytes)
-    (RESULTS_DIR / f"DigLab-{lab}-results.pdf").write_bytes(out_bytes)
+    if doc.name and doc.can_save_incrementally():
+        doc.saveIncr()
+        return None
+    return doc.tobytes(garbage=3, deflate=True)  # image scans: the inserted pixels are stored raw
 
-    return Response(content=out_bytes, media_type="application/pdf")
+mark("imported")
+if PRELOAD:
+    warm_up(WARMUP_STEPS)  # before the server forks its workers; pools still start per worker
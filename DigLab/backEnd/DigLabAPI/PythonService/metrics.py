@@ -0,0 +1,210 @@
+# backEnd/DigLabAPI/PythonService/metrics.py
+"""
+Prometheus metrics without the client library: counters, gauges and histograms
+rendered in the text exposition format by GET /metrics.
+
+- HttpMetrics (ASGI middleware) counts requests and times them per route template
+  ("/analyze", not the raw URL) and tracks requests in flight.
+- stage("render") times one step of the pipeline into diglab_stage_duration_seconds.
+  Stages run inside pool worker processes too: AnalysisPool runs tasks through
+  collect(), which buffers the worker's observations and hands them back with the
+  result, so they land in this process's histogram.
+
+Kept free of FastAPI/app state (imported by worker code). An observation is a
+perf_counter() pair, a bisect and a lock, cheap enough to leave on.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Iterable, Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class _Value(_Metric):
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 read: Optional[Callable[[], dict[tuple, float]]] = None):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+        self._read = read
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        if self._read is not None:
+            items = sorted(self._read().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Counter(_Value):
+    """inc() it, or pass `read` returning {label values: total} at scrape time (e.g. from stats())."""
+    kind = "counter"
+
+
+class Gauge(_Value):
+    """set/inc/dec it, or pass `read` returning {label values: value} at scrape time."""
+    kind = "gauge"
+
+    def set(self, value: float, *labels: Any) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels: Any, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: tuple[float, ...] = REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: Any) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        out = []
+        for k, s in items:
+            cum = 0
+            for le, n in zip((*map(_num, self.buckets), "+Inf"), s[:-1]):
+                cum += n
+                bound = f'le="{le}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, bound)} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(s[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {cum}")
+        return out
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text format."""
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+# ------------------------------------------------------------------ pipeline stages
+STAGE_SECONDS = Histogram("diglab_stage_duration_seconds", "Time spent per pipeline stage",
+                          ("stage",), STAGE_BUCKETS)
+
+_collecting = threading.local()  # .pending: list while collect() runs on this thread (pool task, warm-up)
+
+
+class stage:
+    """`with stage("render"):` times the block into diglab_stage_duration_seconds."""
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "stage":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        dt = time.perf_counter() - self.t0
+        pending = getattr(_collecting, "pending", None)
+        if pending is not None:
+            pending.append((self.name, dt))
+        else:
+            STAGE_SECONDS.observe(dt, self.name)
+
+
+def collect(fn: Callable[..., Any], *args: Any) -> tuple[Any, list[tuple[str, float]]]:
+    """Run fn in a worker process and return (result, stage timings) for observe_stages()."""
+    pending: list[tuple[str, float]] = []
+    _collecting.pending = pending
+    try:
+        return fn(*args), pending
+    finally:
+        _collecting.pending = None
+
+
+def observe_stages(timings: list[tuple[str, float]]) -> None:
+    for name, dt in timings:
+        STAGE_SECONDS.observe(dt, name)
+
+
+# ------------------------------------------------------------------ HTTP
+HTTP_REQUESTS = Counter("diglab_http_requests_total", "HTTP requests", ("route", "method", "status"))
+HTTP_SECONDS = Histogram("diglab_http_request_duration_seconds", "HTTP request latency", ("route", "method"))
+HTTP_IN_FLIGHT = Gauge("diglab_http_requests_in_flight", "HTTP requests being served")
+
+
+class HttpMetrics:
+    """Pure ASGI middleware (no per-request task/queue overhead like BaseHTTPMiddleware)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the (shared) scope; unmatched URLs share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - t0, route, scope["method"])
+            HTTP_REQUESTS.inc(route, scope["method"], status)
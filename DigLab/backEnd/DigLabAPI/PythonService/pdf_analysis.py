@@ -0,0 +1,469 @@
+# backEnd/DigLabAPI/PythonService/pdf_analysis.py
+"""
+Pen-mark analysis of scanned requisition forms.
+Kept free of FastAPI/app state so it can run inside analysis worker processes.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from form_layout import fit_layout, read_layout, requisition_layout, requisition_pdf
+from form_qr import parse_payload, scan_qr
+from metrics import stage
+
+DIAGNOSES = ["Dengue", "Malaria", "TBE", "Hantavirus – Puumalavirus (PuV)"]
+LABNUM_RE = re.compile(r"LAB-\d{8}-[A-Z0-9]{8}")
+
+
+def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
+    parts: list[str] = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc, stage("text_extract"):
+        for page in doc:
+            parts.append(page.get_text("text"))
+    return "\n".join(parts)
+
+def parse_fields_from_text(text: str) -> dict:
+    def grab(pat: str) -> Optional[str]:
+        m = re.search(pat, text, re.IGNORECASE)
+        return m.group(1).strip() if m else None
+
+    name = grab(r"Full Name:\s*(.+)")
+    pnr  = grab(r"Personnummer:\s*([0-9]{11})")
+    date = grab(r"Date:\s*([0-9]{4}-[0-9]{2}-[0-9]{2})")
+    time = grab(r"Time:\s*([0-9]{2}:[0-9]{2})")
+
+    found_dx: List[str] = []
+    for d in DIAGNOSES:
+        if re.search(rf"{re.escape(d)}\s*\[\s*X\s*\]", text, re.IGNORECASE):
+            found_dx.append(d)
+
+    return {"name": name, "personnummer": pnr, "date": date, "time": time, "diagnoses": found_dx or None}
+
+def compute_overall(marks: dict[str, str], requested_only: set[str] | None = None) -> str:
+    items = ((d, v) for d, v in marks.items() if requested_only is None or d in requested_only)
+    vals = [v for _, v in items]
+    has_pos = any(v == "positive" for v in vals)
+    has_neg = any(v == "negative" for v in vals)
+    if has_pos and not has_neg:
+        return "positive"
+    if has_neg and not has_pos:
+        return "negative"
+    if has_pos and has_neg:
+        return "mixed"
+    return "inconclusive"
+
+class PdfAnalysisContext:
+    """
+    One open document and one word extraction (page 0), shared by every analysis step:
+    field parsing, checkbox location, diagnosis row lookup and rendering.
+    DigLab-generated PDFs also carry a layout descriptor (see form_layout.py), which
+    replaces the box/row search entirely.
+    """
+
+    def __init__(self, pdf_bytes: bytes, page_no: Optional[int] = None):
+        self.doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        layout = read_layout(self.doc)
+        if page_no is None:
+            page_no = layout.get("page", 0) if layout else 0
+        elif layout is not None and (len(self.doc) != 1 or layout.get("page", 0) != page_no):
+            layout = None  # one form per page: a document-level descriptor can't describe them all
+        self.layout = layout
+        self.page = self.doc[page_no]
+        self._words: Optional[list[tuple]] = None
+        self._lines: Optional[list[list[tuple]]] = None
+        self._boxes: Optional[list[fitz.Rect]] = None
+
+    def close(self) -> None:
+        self.doc.close()
+
+    def __enter__(self) -> "PdfAnalysisContext":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def words(self) -> list[tuple]:
+        """(x0, y0, x1, y1, word, block_no, line_no, word_no) in reading order."""
+        if self._words is None:
+            with stage("text_extract"):
+                self._words = self.page.get_text("words")
+        return self._words
+
+    @property
+    def lines(self) -> list[list[tuple]]:
+        """Words grouped per text line (same block/line number)."""
+        if self._lines is None:
+            lines: list[list[tuple]] = []
+            key = None
+            for w in self.words:
+                if (w[5], w[6]) != key:
+                    key = (w[5], w[6])
+                    lines.append([])
+                lines[-1].append(w)
+            self._lines = lines
+        return self._lines
+
+    @property
+    def text(self) -> str:
+        return "\n".join(" ".join(w[4] for w in line) for line in self.lines)
+
+    @property
+    def boxes(self) -> list[fitz.Rect]:
+        """
+        Checkbox tokens: "[X]" / "[x]" are single words, while the blank "[    ]"
+        variants split into a "[" word followed by a "]" word on the same line.
+        """
+        if self._boxes is None:
+            boxes: list[fitz.Rect] = []
+            for line in self.lines:
+                i = 0
+                while i < len(line):
+                    tok = line[i][4]
+                    if tok.lower() == "[x]" or tok == "[]":
+                        boxes.append(fitz.Rect(line[i][:4]))
+                    elif tok == "[" and i + 1 < len(line) and line[i + 1][4] == "]":
+                        boxes.append(fitz.Rect(line[i][:4]) | fitz.Rect(line[i + 1][:4]))
+                        i += 1
+                    i += 1
+            self._boxes = boxes
+        return self._boxes
+
+    def find_phrase(self, phrase: str) -> Optional[fitz.Rect]:
+        """First occurrence of `phrase` as consecutive words on one line (case-insensitive)."""
+        return next(self.iter_phrase(phrase), None)
+
+    def iter_phrase(self, phrase: str):
+        target = phrase.lower().split()
+        n = len(target)
+        if not n:
+            return
+        for line in self.lines:
+            toks = [w[4].lower() for w in line]
+            for i in range(len(toks) - n + 1):
+                if toks[i:i + n] == target:
+                    r = fitz.Rect(line[i][:4])
+                    for w in line[i + 1:i + n]:
+                        r |= fitz.Rect(w[:4])
+                    yield r
+
+
+# ROI and threshold knobs (units: PDF points unless otherwise stated)
+ROW_TOL   = 12.0
+PAD_X     = 4.0
+PAD_Y     = 6.0
+WIDEN_MUL = 1.25
+DARK_THR  = 0.08
+RATIO_WIN = 1.25
+INK_LEVEL = 200  # gray level (0-255) below which a pixel counts as dark
+
+def tight_roi(box: fitz.Rect, pad_x: float = PAD_X, pad_y: float = PAD_Y, widen: float = WIDEN_MUL) -> fitz.Rect:
+    w = box.width * widen
+    cx = 0.5 * (box.x0 + box.x1)
+    x0, x1 = cx - 0.5 * w, cx + 0.5 * w
+    y0, y1 = box.y0 - pad_y, box.y1 + pad_y
+    return fitz.Rect(x0 - pad_x, y0, x1 + pad_x, y1)
+
+def classify_mark(df_pos: float, df_neg: float) -> str:
+    """Dark fractions of the Positive/Negative ROIs -> "positive" | "negative" | "none"."""
+    if df_pos < DARK_THR and df_neg < DARK_THR:
+        return "none"
+    if df_pos >= df_neg * RATIO_WIN:
+        return "positive"
+    if df_neg >= df_pos * RATIO_WIN:
+        return "negative"
+    return "positive" if df_pos >= df_neg else "negative"
+
+
+RENDER_MODES = ("full", "union", "clip")
+RENDER_DPI = 300
+
+
+def _roi_pixels(page: fitz.Page, rois: list[fitz.Rect], scale: float) -> list[Optional[tuple[int, int, int, int]]]:
+    """ROI rects (points) -> pixel boxes on the full-page raster, clamped; None if empty."""
+    bounds = (page.rect * fitz.Matrix(scale, scale)).irect
+    out: list[Optional[tuple[int, int, int, int]]] = []
+    for r in rois:
+        x0, y0 = max(int(r.x0 * scale), 0), max(int(r.y0 * scale), 0)
+        x1, y1 = min(int(r.x1 * scale), bounds.width), min(int(r.y1 * scale), bounds.height)
+        out.append((x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None)
+    return out
+
+def pixel_union(boxes: list[tuple[int, int, int, int]]) -> tuple[int, int, int, int]:
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def _gray_array(pix: fitz.Pixmap) -> np.ndarray:
+    """Zero-copy (height, width) view of a grayscale pixmap's samples; only valid while `pix` lives."""
+    arr = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return arr[:, :pix.width]
+
+def _rgb_luma(pix: fitz.Pixmap, box: tuple[int, int, int, int]) -> np.ndarray:
+    """Grayscale of `box` (page pixels) of an RGB pixmap, bit-identical to PIL's convert("L")."""
+    rgb = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    x0, y0, x1, y1 = box[0] - pix.x, box[1] - pix.y, box[2] - pix.x, box[3] - pix.y
+    px = rgb[y0:y1, 3 * x0:3 * x1].reshape(y1 - y0, x1 - x0, 3).astype(np.uint32)
+    return ((px[..., 0] * 19595 + px[..., 1] * 38470 + px[..., 2] * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+
+SAT_MIN_BOXES = 256  # below this many ROIs, counting each one directly beats building the table
+
+class DarkMask:
+    """
+    Dark pixels (< INK_LEVEL) of a grayscale raster, thresholded once. A few ROIs are
+    counted directly; larger sets (e.g. candidate paddings / widenings, see tight_roi)
+    go through a summed-area table built in one pass, after which every ROI is four lookups.
+    `origin` is the raster's top-left pixel on the page; boxes are in page pixels.
+    """
+    __slots__ = ("mask", "x", "y", "_sat")
+
+    def __init__(self, gray: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        self.mask = gray < INK_LEVEL
+        self.x, self.y = origin
+        self._sat: Optional[np.ndarray] = None
+
+    def integral(self) -> np.ndarray:
+        """(h+1, w+1) table: sat[y, x] = dark pixels above and left of (x, y)."""
+        if self._sat is None:
+            h, w = self.mask.shape
+            sat = np.zeros((h + 1, w + 1), dtype=np.int32)
+            np.cumsum(self.mask, axis=1, dtype=np.int32, out=sat[1:, 1:])
+            np.cumsum(sat[1:, 1:], axis=0, out=sat[1:, 1:])
+            self._sat = sat
+        return self._sat
+
+    def fractions(self, boxes: list[Optional[tuple[int, int, int, int]]]) -> list[float]:
+        """Dark fraction per box (0.0 for None)."""
+        live = [b for b in boxes if b is not None]
+        if not live:
+            return [0.0] * len(boxes)
+        if len(live) < SAT_MIN_BOXES and self._sat is None:
+            m, ox, oy = self.mask, self.x, self.y
+            it = iter([np.count_nonzero(m[y0 - oy:y1 - oy, x0 - ox:x1 - ox]) / ((x1 - x0) * (y1 - y0))
+                       for x0, y0, x1, y1 in live])
+        else:
+            s = self.integral()
+            x0, y0, x1, y1 = (np.array(live) - (self.x, self.y, self.x, self.y)).T
+            dark = s[y1, x1] - s[y0, x1] - s[y1, x0] + s[y0, x0]
+            it = iter((dark / ((x1 - x0) * (y1 - y0))).tolist())
+        return [0.0 if b is None else next(it) for b in boxes]
+
+
+def read_page_qr(page: fitz.Page) -> Optional[str]:
+    """Decode the requisition QR from a rendered page, cheapest render first (see form_qr)."""
+    def render(dpi: int, band: Optional[tuple]) -> np.ndarray:
+        r = page.rect
+        clip = None if band is None else fitz.Rect(r.x0 + band[0] * r.width, r.y0 + band[1] * r.height,
+                                                   r.x0 + band[2] * r.width, r.y0 + band[3] * r.height)
+        pix = page.get_pixmap(dpi=dpi, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        return _gray_array(pix).copy()  # outlives the pixmap
+    with stage("qr_decode"):
+        return scan_qr(render)
+
+def dark_fractions(page: fitz.Page, rois: list[fitz.Rect], render: str = "union") -> list[float]:
+    """
+    Fraction of dark pixels (< INK_LEVEL) inside each ROI, rendered WITH ink annotations at 300 DPI.
+
+    render="full"  : whole page to RGB, luma (PIL's formula) of the ROIs' bounding box
+    render="union" : one grayscale pixmap clipped to the union of all ROIs
+    render="clip"  : one grayscale pixmap per ROI, sharing a single display list
+    full/union threshold the ROIs' bounding box once and score every ROI from it (DarkMask).
+    All modes sample the same pixel grid; MuPDF's grayscale conversion only differs from
+    PIL's on anti-aliased edge pixels, which leaves the classifications unchanged.
+    """
+    if render not in RENDER_MODES:
+        raise ValueError(f"render must be one of {RENDER_MODES}")
+    scale = RENDER_DPI / 72.0
+    mat = fitz.Matrix(scale, scale)
+    boxes = _roi_pixels(page, rois, scale)
+    live = [b for b in boxes if b is not None]
+    if not live:
+        return [0.0] * len(rois)
+    union = pixel_union(live)
+
+    if render == "full":
+        with stage("render"):
+            pix = page.get_pixmap(matrix=mat, alpha=False, annots=True)
+        with stage("roi_score"):
+            return DarkMask(_rgb_luma(pix, union), union[:2]).fractions(boxes)
+
+    if render == "union":
+        with stage("render"):
+            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False, annots=True,
+                                  clip=fitz.Rect(union) / scale)
+        with stage("roi_score"):
+            return DarkMask(_gray_array(pix), (pix.x, pix.y)).fractions(boxes)
+
+    with stage("render"):
+        dl = page.get_displaylist(annots=True)
+    out: list[float] = []
+    for b in boxes:
+        if b is None:
+            out.append(0.0)
+            continue
+        with stage("render"):
+            pix = dl.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False, clip=fitz.Rect(b) / scale)
+        with stage("roi_score"):
+            arr = _gray_array(pix)
+            out.append(float((arr[b[1] - pix.y:b[3] - pix.y, b[0] - pix.x:b[2] - pix.x] < INK_LEVEL).mean()))
+    return out
+
+
+def analyze_pen_marks_from_pdf(pdf_bytes: bytes, requested_only: set[str] | None = None,
+                               render: str = "union") -> dict[str, str]:
+    with PdfAnalysisContext(pdf_bytes) as ctx:
+        return analyze_pen_marks(ctx, requested_only=requested_only, render=render)
+
+def analyze_pen_marks(ctx: PdfAnalysisContext, requested_only: set[str] | None = None,
+                      render: str = "union") -> dict[str, str]:
+    """
+    Detect pen marks near the Positive/Negative boxes per diagnosis.
+    Only evaluates rows in `requested_only` if provided.
+    """
+    marks: dict[str, str] = {}
+
+    def row_mid_y(r: fitz.Rect) -> float:
+        return 0.5 * (r.y0 + r.y1)
+
+    row_tol = ROW_TOL
+
+    # 1) Locate the Positive/Negative boxes of every row we need
+    rows: dict[str, tuple[fitz.Rect, fitz.Rect]] = {}
+    layout_rows = (ctx.layout or {}).get("rows") or {}
+    with stage("box_locate"):
+        for d in DIAGNOSES:
+            marks[d] = "none"
+            if requested_only is not None and d not in requested_only:
+                continue
+
+            # Fast path: boxes recorded by the generator
+            if d in layout_rows:
+                boxes = layout_rows[d]["boxes"]
+                rows[d] = (tight_roi(fitz.Rect(boxes["positive"])), tight_roi(fitz.Rect(boxes["negative"])))
+                continue
+            if ctx.layout is not None:
+                continue
+
+            # Foreign document: find the row and its boxes in the word list
+            box_rects = ctx.boxes
+            hit = ctx.find_phrase(d)
+            if hit is None:
+                continue
+
+            cy = row_mid_y(hit)
+            row_boxes = [r for r in box_rects if abs(row_mid_y(r) - cy) <= row_tol]
+            if len(row_boxes) < 3:
+                continue
+
+            # Choose the 3 most aligned; left->right = [Requested, Positive, Negative]
+            row_boxes.sort(key=lambda r: abs(row_mid_y(r) - cy))
+            row_boxes = row_boxes[:3]
+            row_boxes.sort(key=lambda r: r.x0)
+            _, pos_box, neg_box = row_boxes
+            rows[d] = (tight_roi(pos_box), tight_roi(neg_box))
+
+    if not rows:
+        return marks
+
+    # 2) Render only what is needed and score every ROI in one go
+    rois = [roi for pair in rows.values() for roi in pair]
+    fractions = dark_fractions(ctx.page, rois, render=render)
+
+    for i, d in enumerate(rows):
+        marks[d] = classify_mark(fractions[2 * i], fractions[2 * i + 1])
+
+    return marks
+
+SIGNATURE_TERMS = ("Received by:", "Collected by:", "Signatures")
+
+def signature_anchor(ctx: PdfAnalysisContext, page_index: int) -> Optional[dict]:
+    """
+    Where /finalize-form stamps: bottom of the signature block on the analysed page, plus
+    that page's size, so finalizing needn't search the saved scan again.
+    `page_index` is the page's index in the scan as saved.
+    """
+    r = ctx.page.rect
+    size = [round(r.width, 3), round(r.height, 3)]
+    if ctx.layout is not None and ctx.layout.get("signature"):
+        return {"page": page_index, "y": ctx.layout["signature"]["y"], "page_size": size}
+    hits = [rect.y1 for t in SIGNATURE_TERMS for rect in ctx.iter_phrase(t)]
+    if not hits:
+        return None
+    return {"page": page_index, "y": max(hits), "page_size": size}
+
+def analyze_pdf(pdf_bytes: bytes, render: str = "union", forms_dir: Optional[str] = None) -> dict:
+    """
+    Full /analyze pipeline for one uploaded PDF (runs in a worker process).
+    Returns labnummer, overall result, parsed fields and per-diagnosis marks
+    (+ the signature anchor under "anchor" for single-page scans).
+    Scans without a text layer take their boxes from the requisition in `forms_dir`.
+    """
+    with PdfAnalysisContext(pdf_bytes) as ctx:
+        res = _analyze(ctx, render, forms_dir)
+        res["anchor"] = signature_anchor(ctx, 0) if len(ctx.doc) == 1 else None
+        return res
+
+def analyze_pdf_page(pdf_bytes: bytes, page_no: int, render: str = "union", forms_dir: Optional[str] = None) -> dict:
+    """
+    Batch variant for multi-form PDFs (one form per page).
+    Also returns the page as its own PDF under "pdf", so it can be saved as that form's scan.
+    """
+    with PdfAnalysisContext(pdf_bytes, page_no=page_no) as ctx:
+        res = _analyze(ctx, render, forms_dir)
+        res["anchor"] = signature_anchor(ctx, 0)  # the page is saved as its own one-page scan
+        with fitz.open() as single:
+            single.insert_pdf(ctx.doc, from_page=page_no, to_page=page_no)
+            with stage("tobytes"):
+                res["pdf"] = single.tobytes(garbage=3, deflate=True)
+    return res
+
+def count_pages(pdf_bytes: bytes) -> int:
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return len(doc)
+
+def _analyze(ctx: PdfAnalysisContext, render: str, forms_dir: Optional[str] = None) -> dict:
+    # Text (rebuilt from the word list) gives labnummer & requested diagnoses
+    text = ctx.text
+    m = LABNUM_RE.search(text)
+    labnummer = m.group(0) if m else None
+
+    found = parse_fields_from_text(text)
+    requested: set[str] = set(found.get("diagnoses") or [])  # ONLY requested rows count
+
+    if ctx.layout is not None:
+        # The descriptor is read from the upload: only a well-formed labnummer may name files
+        m = LABNUM_RE.fullmatch(str(ctx.layout.get("labnummer") or "").upper())
+        labnummer = m.group(0) if m else labnummer
+        requested = {d for d, row in ctx.layout["rows"].items() if row.get("requested")}
+    elif labnummer is None:
+        # No text layer (paper scan): identify the form from its QR instead of OCR
+        qr_id, qr_dx = parse_payload(read_page_qr(ctx.page) or "", DIAGNOSES)
+        m = LABNUM_RE.fullmatch(qr_id.upper())
+        labnummer = m.group(0) if m else None
+        if qr_dx is not None and not requested:
+            requested = set(qr_dx)
+            found["diagnoses"] = qr_dx or None
+        # ...and its boxes from the requisition it was printed from, scaled onto this page
+        form_pdf = requisition_pdf(forms_dir, labnummer)
+        layout = requisition_layout(str(form_pdf) if form_pdf else None)
+        if layout is not None:
+            ctx.layout = fit_layout(layout, ctx.page.rect.width, ctx.page.rect.height)
+            requested = {d for d, row in layout["rows"].items() if row.get("requested")}
+            found["diagnoses"] = [d for d in DIAGNOSES if d in requested] or None
+
+    # Detect pen marks ONLY in requested rows
+    pen = analyze_pen_marks(ctx, requested_only=requested, render=render)
+
+    # Build marks for all rows (unrequested -> "none")
+    marks = {d: (pen.get(d, "none") if d in requested else "none") for d in DIAGNOSES}
+
+    return {
+        "labnummer": labnummer,
+        "result": compute_overall(marks, requested_only=requested),
+        "found": found,
+        "marks": marks,
+    }
@@ -1,6 +1,9 @@
 # backEnd/DigLabAPI/PythonService/pdf_form.py
+import io
+from functools import lru_cache
 from pathlib import Path
 from typing import List
+from xml.sax.saxutils import escape
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import (
@@ -9,12 +12,63 @@ from reportlab.platypus import (
 from reportlab.lib import colors
 from reportlab.lib.units import mm
 
+import fitz  # PyMuPDF – only for font metrics + writing the layout descriptor
+
+from form_layout import embed_layout, write_layout
+from metrics import stage
+
 ALL_DIAGNOSES = ["Dengue", "Malaria", "TBE", "Hantavirus – Puumalavirus (PuV)"]
 
 BOX_BLANK = "[    ]"  # 4 spaces, To make easier for human mistakes 
 BOX_X     = "[X]"     # 1 space, registert automatic from pdf form
 BOX_EMPTY = "[ ]"     # 1 space, automaticly left empty, if no dignoesis
 
+BOX_FONT, BOX_FONT_SIZE = "Courier", 12
+BOX_PADDING = 2
+BOX_COLUMNS = ("requested", "positive", "negative")
+
+
+class PlacedTable(Table):
+    """Table that remembers where it was drawn: (page index, x, y) of its bottom-left corner."""
+    placed_at: tuple[int, float, float] | None = None
+
+    def draw(self):
+        self.placed_at = (self.canv.getPageNumber() - 1, *self.canv.absolutePosition(0, 0))
+        Table.draw(self)
+
+    def cell_baseline(self, row: int, col: int, *, padding: float, font_size: float, leading: float) -> tuple[float, float]:
+        """Absolute (x, baseline y) of a LEFT/MIDDLE aligned single-line string cell (ReportLab coords)."""
+        _, x, y = self.placed_at
+        row_bottom = y + self._rowpositions[row + 1]
+        row_height = self._rowpositions[row] - self._rowpositions[row + 1]
+        base = row_bottom + (padding + row_height - padding + leading) / 2.0 - font_size
+        return x + self._colpositions[col] + padding, base
+
+
+@lru_cache(maxsize=None)
+def _font(name: str) -> fitz.Font:
+    return fitz.Font(name)
+
+@lru_cache(maxsize=256)
+def _text_length(text: str, font: str, size: float) -> float:
+    return _font(font).text_length(text, size)
+
+def _text_rect(x: float, baseline: float, text: str, font: str, size: float, page_h: float) -> list[float]:
+    """Glyph box of `text` as PyMuPDF reports it (ascender/descender), in top-left page coords."""
+    f = _font(font)
+    return [
+        round(x, 3),
+        round(page_h - baseline - f.ascender * size, 3),
+        round(x + _text_length(text, font, size), 3),
+        round(page_h - baseline - f.descender * size, 3),
+    ]
+
+def _image_source(src):
+    """ReportLab image source from PNG bytes, a file-like object or a path."""
+    if isinstance(src, (bytes, bytearray)):
+        return io.BytesIO(src)
+    return src if hasattr(src, "read") else str(src)
+
 def generate_lab_form_pdf(
     out_pdf: Path,
     *,
@@ -23,7 +77,7 @@ def generate_lab_form_pdf(
     date: str,
     time: str,
     diagnoses: List[str],
-    qr_png: Path,
+    qr_png: Path | bytes,
     personnummer: str | None = None,
     hospital: str = "DigLab",
     qr_label: str | None = None,
@@ -33,17 +87,78 @@ def generate_lab_form_pdf(
     - Monospace checkboxes in Requested / Positive / Negative columns.
     - Positive/Negative are always BOX_BLANK so pen marks are needed.
     - Tight padding around tokens so PyMuPDF search_for() gives precise boxes.
+    (form_template.py renders the same form from a cached template; this is the reference build.)
     """
+    layout = _build_requisition(out_pdf, labnummer, name, date, time, diagnoses, qr_png, personnummer, hospital, qr_label)
+    embed_layout(out_pdf, layout)
+
+
+def generate_lab_form_bytes(
+    *,
+    labnummer: str,
+    name: str,
+    date: str,
+    time: str,
+    diagnoses: List[str],
+    qr_png: Path | bytes,
+    personnummer: str | None = None,
+    hospital: str = "DigLab",
+    qr_label: str | None = None,
+) -> bytes:
+    """generate_lab_form_pdf into memory."""
+    buf = io.BytesIO()
+    layout = _build_requisition(buf, labnummer, name, date, time, diagnoses, qr_png, personnummer, hospital, qr_label)
+    with fitz.open("pdf", buf.getvalue()) as doc:
+        write_layout(doc, layout)
+        with stage("tobytes"):
+            return doc.tobytes(deflate=True)
+
+
+def _build_requisition(out_pdf, labnummer, name, date, time, diagnoses, qr_png, personnummer, hospital, qr_label) -> dict:
+    sel = set(diagnoses or [])
+    diag_tab, sign_tab = build_form(
+        out_pdf,
+        hospital=hospital,
+        qr_png=qr_png,
+        qr_text=qr_label or labnummer,
+        info_rows=info_rows(name=name, date=date, time=time, labnummer=labnummer, personnummer=personnummer),
+        requested_cells=[BOX_X if d in sel else BOX_EMPTY for d in ALL_DIAGNOSES],
+    )
+    return form_layout(labnummer, sel, diag_tab, sign_tab)
+
+
+def info_rows(*, name: str, date: str, time: str, labnummer: str, personnummer: str | None) -> list[list[str]]:
+    rows = [
+        ["Full Name:", name],
+        ["Date:", date],
+        ["Time:", time],
+        ["Labnummer:", labnummer],
+    ]
+    if personnummer:
+        rows.insert(1, ["Personnummer:", personnummer])
+    return rows
+
+
+def build_form(
+    out_pdf,
+    *,
+    hospital: str,
+    qr_png: Path | bytes,
+    qr_text: str,
+    info_rows: list[list[str]],
+    requested_cells: list[str],
+) -> tuple[PlacedTable, PlacedTable]:
+    """Lay out and write the form (path or file-like). Returns the placed diagnosis + signature tables."""
     styles = getSampleStyleSheet()
     doc = SimpleDocTemplate(
-        str(out_pdf),
+        out_pdf if hasattr(out_pdf, "write") else str(out_pdf),
         pagesize=A4,
         leftMargin=24, rightMargin=24, topMargin=24, bottomMargin=24
     )
     elements = []
 
     # ---------- Header with QR ----------
-    qr_img = Image(str(qr_png), width=30*mm, height=30*mm)
+    qr_img = Image(_image_source(qr_png), width=30*mm, height=30*mm)
     header = Table(
         [
             [Paragraph(f"<b>{hospital}</b>", styles["Heading2"]),
@@ -57,20 +172,10 @@ def generate_lab_form_pdf(
     ]))
     elements.append(header)
 
-    qr_text = qr_label or labnummer
-    elements.append(Paragraph(f"<font size=9><b>QR encodes:</b> {qr_text}</font>", styles["Normal"]))
+    elements.append(Paragraph(f"<font size=9><b>QR encodes:</b> {escape(qr_text)}</font>", styles["Normal"]))
     elements.append(Spacer(1, 8))
 
     # ---------- Patient info ----------
-    info_rows = [
-        ["Full Name:", name],
-        ["Date:", date],
-        ["Time:", time],
-        ["Labnummer:", labnummer],
-    ]
-    if personnummer:
-        info_rows.insert(1, ["Personnummer:", personnummer])
-
     elements.append(Paragraph("<b>Patient Information</b>", styles["Heading3"]))
     info_tab = Table(info_rows, colWidths=[200, 300])
     info_tab.setStyle(TableStyle([
@@ -91,17 +196,15 @@ def generate_lab_form_pdf(
     # ---------- Diagnoses ----------
     elements.append(Paragraph("<b>Requested Analyses & Results</b>", styles["Heading3"]))
 
-    sel = set(diagnoses or [])
     diag_rows = [["Diagnosis", "Requested", "Positive", "Negative"]]
-    for d in ALL_DIAGNOSES:
-        requested_cell = BOX_X if d in sel else BOX_EMPTY
+    for d, requested_cell in zip(ALL_DIAGNOSES, requested_cells):
         diag_rows.append([d, requested_cell, BOX_BLANK, BOX_BLANK])
 
     # Freeform "Other"
     diag_rows.append(["Other: __________________________", BOX_BLANK, BOX_BLANK, BOX_BLANK])
 
     # Wider first column; narrow checkbox columns so tokens stay compact
-    diag_tab = Table(diag_rows, colWidths=[260, 80, 80, 80])
+    diag_tab = PlacedTable(diag_rows, colWidths=[260, 80, 80, 80])
 
     diag_tab.setStyle(TableStyle([
         # header
@@ -119,14 +222,14 @@ def generate_lab_form_pdf(
         ('VALIGN',     (0,1), (-1,-1), 'MIDDLE'),
 
         # --- checkbox columns use monospace + tight padding ---
-        ('FONTNAME',   (1,1), (-1,-1), 'Courier'),  # <-- monospace for [    ]
-        ('FONTSIZE',   (1,1), (-1,-1), 12),
+        ('FONTNAME',   (1,1), (-1,-1), BOX_FONT),  # <-- monospace for [    ]
+        ('FONTSIZE',   (1,1), (-1,-1), BOX_FONT_SIZE),
 
         # Tighten padding so search_for() box ≈ visible token width/height
-        ('LEFTPADDING',  (1,1), (-1,-1), 2),
-        ('RIGHTPADDING', (1,1), (-1,-1), 2),
-        ('TOPPADDING',   (1,1), (-1,-1), 2),
-        ('BOTTOMPADDING',(1,1), (-1,-1), 2),
+        ('LEFTPADDING',  (1,1), (-1,-1), BOX_PADDING),
+        ('RIGHTPADDING', (1,1), (-1,-1), BOX_PADDING),
+        ('TOPPADDING',   (1,1), (-1,-1), BOX_PADDING),
+        ('BOTTOMPADDING',(1,1), (-1,-1), BOX_PADDING),
 
         # Optional: a touch more vertical room for handwriting
         ('TOPPADDING',   (0,1), (0,-1), 3),
@@ -137,7 +240,7 @@ def generate_lab_form_pdf(
 
     # ---------- Signatures ----------
     elements.append(Paragraph("<b>Signatures</b>", styles["Heading3"]))
-    sign_tab = Table(
+    sign_tab = PlacedTable(
         [
             ["Collected by:", "___________________ (Signature + ID)"],
             ["Received by:",  "___________________ (Signature + Timestamp)"]
@@ -151,4 +254,31 @@ def generate_lab_form_pdf(
     elements.append(sign_tab)
 
     # ---------- Build ----------
-    doc.build(elements)
+    with stage("reportlab_build"):
+        doc.build(elements)
+    return diag_tab, sign_tab
+
+
+def form_layout(labnummer: str, sel: set[str], diag_tab: PlacedTable, sign_tab: PlacedTable) -> dict:
+    """Layout descriptor (read back by /analyze and /finalize-form) from the placed tables."""
+    page_w, page_h = A4
+    rows = {}
+    for i, d in enumerate(ALL_DIAGNOSES, start=1):
+        cells = (BOX_X if d in sel else BOX_EMPTY, BOX_BLANK, BOX_BLANK)
+        boxes = {}
+        for col, (key, text) in enumerate(zip(BOX_COLUMNS, cells), start=1):
+            x, base = diag_tab.cell_baseline(i, col, padding=BOX_PADDING, font_size=BOX_FONT_SIZE, leading=12)
+            boxes[key] = _text_rect(x, base, text, "cour", BOX_FONT_SIZE, page_h)
+        rows[d] = {"requested": d in sel, "boxes": boxes}
+
+    # Bottom edge of the "Received by:" label (default cell style: Helvetica 10/12, padding 3)
+    x, base = sign_tab.cell_baseline(1, 0, padding=3, font_size=10, leading=12)
+    signature_y = _text_rect(x, base, "Received by:", "helv", 10, page_h)[3]
+
+    return {
+        "labnummer": labnummer,
+        "page": diag_tab.placed_at[0],
+        "page_size": [round(page_w, 3), round(page_h, 3)],
+        "rows": rows,
+        "signature": {"page": sign_tab.placed_at[0], "y": signature_y},
+    }
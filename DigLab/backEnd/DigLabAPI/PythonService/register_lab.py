@@ -2,23 +2,23 @@
 """
 Registers a blood sample (file-based, no DB).
 - Prompts for: personnummer (11), date (YYYY-MM-DD), time (HH:MM)
-- Generates labnummer: LAB-YYYYMMDD-XXXXXXXXXX
-- Appends: labnummer,personnummer,dato,klokke,created_at to samples.csv
+- Generates labnummer: LAB-YYYYMMDD-XXXXXXXX (same format as the service's /register)
+- Appends: labnummer,personnummer,date,time,created_at to samples.csv
+Uses the service's samples.csv (DIGLAB_DATA_DIR, as main.py) and its lock, so it can
+run next to any number of service workers.
 """
-import csv, re, uuid
+import csv, os, re, uuid
 from datetime import datetime
 from pathlib import Path
 
-CSV_PATH = Path(__file__).with_name("samples.csv")
+from sample_store import SampleStore
+
+CSV_PATH = Path(os.environ.get("DIGLAB_DATA_DIR") or Path(__file__).parent) / "samples.csv"
+samples = SampleStore(CSV_PATH)  # header + samples.csv.lock shared with the running service
 PERSONNR_RE = re.compile(r"^\d{11}$")
 DATE_FMT = "%Y-%m-%d"
 TIME_FMT = "%H:%M"
 
-def ensure_csv():
-    if not CSV_PATH.exists():
-        with CSV_PATH.open("w", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(["labnummer","personnummer","dato","klokke","created_at"])
-
 def prompt_personnummer():
     while True:
         s = input("Personnummer (11 siffer): ").strip()
@@ -41,24 +41,26 @@ def prompt_time():
         except ValueError:
             print("  -> Ugyldig klokkeslett. Eksempel: 14:37.")
 
-def gen_labnummer():
-    return f"LAB-{datetime.now():%Y%m%d}-{uuid.uuid4().hex[:10].upper()}"
+def gen_labnummer(date_iso):
+    return f"LAB-{date_iso.replace('-', '')}-{uuid.uuid4().hex[:8].upper()}"
 
-def append_sample(labnummer, personnummer, dato, klokke):
-    ensure_csv()
-    with CSV_PATH.open("a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([labnummer, personnummer, dato, klokke,
-                                datetime.now().isoformat(timespec="seconds")])
+def append_sample(labnummer, personnummer, date_iso, time_hm):
+    # One row needs no group commit (and no index of the whole file): write it directly
+    samples.ensure()
+    with samples.file_lock, CSV_PATH.open("a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([labnummer, personnummer, date_iso, time_hm, datetime.utcnow().isoformat()])
+        f.flush()
+        os.fsync(f.fileno())
 
 def main():
     print("=== Registrer blodprøve (fil-basert) ===\n")
     pn = prompt_personnummer()
     d  = prompt_date()
     t  = prompt_time()
-    labnr = gen_labnummer()
+    labnr = gen_labnummer(d)
     append_sample(labnr, pn, d, t)
 
-    print("\n✅ Lagret i samples.csv")
+    print(f"\n✅ Lagret i {CSV_PATH}")
     print(f"  Personnummer : {pn}")
     print(f"  Dato         : {d}")
     print(f"  Klokke       : {t}")
@@ -0,0 +1,372 @@
+# backEnd/DigLabAPI/PythonService/sample_store.py
+"""
+Indexed sample registry on top of samples.csv.
+
+The CSV stays the source of truth (register_lab.py and other tools keep
+appending to it), but lookups are served from in-memory hash indexes:
+
+- the file is parsed once on first use,
+- afterwards only the bytes appended since the last read are parsed
+  (tracked by byte offset + inode/size/mtime), so each lookup costs one stat(),
+- rows written under the legacy header (dato/klokke) are normalised to the
+  current schema (date/time),
+- a sorted secondary index on (date, time) -- one for all rows, one per
+  personnummer -- answers date-range queries with two bisections and pages
+  through them by key (`query()`, GET /samples); appends mostly arrive in date
+  order, so keeping the index sorted is usually a list append,
+- appends go through a group-commit writer: one thread owns the file handle and
+  flushes queued rows in batches (size/latency window); `append()` only returns
+  once the batch holding its row is flushed and fsync'ed,
+- every batch is written under samples.csv.lock (see file_lock.py), so several
+  service processes (uvicorn --workers, replicas on a shared data directory) and
+  register_lab.py can append without interleaving rows; each process sees the
+  others' rows on its next lookup.
+
+Migrate an old file in place with:
+  python3 sample_store.py --migrate [path/to/samples.csv]
+"""
+from __future__ import annotations
+
+import base64
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Iterable, Optional
+
+from file_lock import LOCK_SUFFIX, FileLock
+
+FIELDNAMES = ["labnummer", "personnummer", "date", "time", "created_at"]
+LEGACY_FIELDS = {"dato": "date", "klokke": "time"}
+
+SortKey = tuple[str, str, int]  # (date, time, row number in the file): index order and page cursor
+
+
+def normalise_header(header: list[str]) -> list[str]:
+    cols = [h.strip().lower() for h in header]
+    return [LEGACY_FIELDS.get(c, c) for c in cols]
+
+
+def encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Inverse of encode_cursor; ValueError for anything it did not produce."""
+    try:
+        date, time_hm, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    if not (isinstance(date, str) and isinstance(time_hm, str) and isinstance(row_id, int)):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return date, time_hm, row_id
+
+
+def _append_key(keys: list[SortKey], key: SortKey) -> bool:
+    """Append `key`; False if that broke the order (the list then needs a sort)."""
+    keys.append(key)
+    return len(keys) < 2 or keys[-2] <= key
+
+
+class SampleStore:
+    """
+    Hash-indexed view of samples.csv.
+    Rows are kept as tuples in file order; `_by_lab` points into that list, `_by_date` and
+    `_by_person` hold sorted SortKeys (whose row number points into it).
+    """
+
+    def __init__(self, csv_path: Path, *, batch_size: int = 256, batch_wait: float = 0.005, fsync: bool = True):
+        self.csv_path = Path(csv_path)
+        self._lock = threading.RLock()
+        self.file_lock = FileLock(self.csv_path.with_name(self.csv_path.name + LOCK_SUFFIX))  # cross-process writes
+        self._reset()
+        self._writer = GroupCommitWriter(self, batch_size=batch_size, batch_wait=batch_wait, fsync=fsync)
+
+    def _reset(self) -> None:
+        self._set_fields(list(FIELDNAMES))
+        self._rows: list[tuple[str, ...]] = []
+        self._by_lab: dict[str, int] = {}
+        self._by_date: list[SortKey] = []
+        self._by_person: dict[str, list[SortKey]] = {}
+        self._unsorted: set[Optional[str]] = set()  # personnummers (None: _by_date) to re-sort
+        self._offset = 0
+        self._ino: Optional[int] = None
+        self._mtime_ns = 0
+
+    # ------------------------------------------------------------------ file
+    def ensure(self) -> None:
+        if self.csv_path.exists():
+            return
+        with self.file_lock:
+            if not self.csv_path.exists():
+                with self.csv_path.open("w", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerow(FIELDNAMES)
+
+    def append(self, row: Iterable[str], timeout: Optional[float] = None) -> None:
+        """Queue one row and block until its batch is durable."""
+        self._writer.submit(list(row)).result(timeout)
+
+    def append_many(self, rows: Iterable[Iterable[str]], timeout: Optional[float] = None) -> None:
+        futures = [self._writer.submit(list(r)) for r in rows]
+        for fut in futures:
+            fut.result(timeout)
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def refresh(self) -> None:
+        """Sync indexes with the file, reading only what was appended since last time."""
+        with self._lock:
+            try:
+                st = os.stat(self.csv_path)
+            except FileNotFoundError:
+                self._reset()
+                return
+
+            # Replaced or truncated (e.g. --migrate, manual edit) -> full reload
+            if st.st_ino != self._ino or st.st_size < self._offset:
+                self._reset()
+                self._ino = st.st_ino
+            elif st.st_size == self._offset and st.st_mtime_ns == self._mtime_ns:
+                return
+
+            with self.csv_path.open("rb") as f:
+                f.seek(self._offset)
+                chunk = f.read(st.st_size - self._offset)
+
+            # A writer may be mid-row; only consume complete lines
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                self._mtime_ns = st.st_mtime_ns
+                return
+            chunk = chunk[: end + 1]
+            start_offset = self._offset
+            self._offset += len(chunk)
+            self._mtime_ns = st.st_mtime_ns
+
+            reader = csv.reader(io.StringIO(chunk.decode("utf-8-sig" if start_offset == 0 else "utf-8")))
+            if start_offset == 0:
+                header = next(reader, None)
+                if header:
+                    self._set_fields(normalise_header(header))
+            for rec in reader:
+                if rec:
+                    self._index(rec)
+            for pnr in self._unsorted:
+                (self._by_date if pnr is None else self._by_person[pnr]).sort()
+            self._unsorted.clear()
+
+    def _set_fields(self, fields: list[str]) -> None:
+        self._fields = fields
+        # Positions of the indexed columns; a missing one points past the row (always "")
+        self._cols = [fields.index(c) if c in fields else len(fields) for c in ("labnummer", "personnummer", "date", "time")]
+
+    def _index(self, rec: list[str]) -> None:
+        n = len(self._fields)
+        padded = rec[:n]
+        padded += [""] * (n + 1 - len(padded))
+        row_id = len(self._rows)
+        self._rows.append(tuple(padded[:n]))
+
+        lab_i, pnr_i, date_i, time_i = self._cols
+        lab = padded[lab_i].strip().upper()
+        if lab:
+            self._by_lab.setdefault(lab, row_id)  # first registration wins, like the old linear scan
+        key = (padded[date_i].strip(), padded[time_i].strip(), row_id)
+        if not _append_key(self._by_date, key):
+            self._unsorted.add(None)
+        pnr = padded[pnr_i].strip()
+        if pnr and not _append_key(self._by_person.setdefault(pnr, []), key):
+            self._unsorted.add(pnr)
+
+    # --------------------------------------------------------------- queries
+    def _as_dict(self, row_id: int) -> dict:
+        return dict(zip(self._fields, self._rows[row_id]))
+
+    def get(self, labnummer: str) -> Optional[dict]:
+        with self._lock:
+            self.refresh()
+            row_id = self._by_lab.get(labnummer.strip().upper())
+            return None if row_id is None else self._as_dict(row_id)
+
+    def first_for_person(self, personnummer: str) -> Optional[dict]:
+        with self._lock:
+            self.refresh()
+            keys = self._by_person.get(personnummer.strip())
+            return self._as_dict(min(k[2] for k in keys)) if keys else None  # first registered
+
+    def query(
+        self,
+        personnummer: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        *,
+        limit: int = 50,
+        after: Optional[SortKey] = None,
+        descending: bool = False,
+    ) -> tuple[list[dict], int, Optional[SortKey]]:
+        """
+        Samples of one person (or everyone) dated date_from..date_to (ISO dates, both
+        inclusive), ordered by date + time, one page of `limit` after the key `after`.
+        Returns (page, total matches, key for the next page or None on the last one).
+        """
+        with self._lock:
+            self.refresh()
+            keys = self._by_date if personnummer is None else self._by_person.get(personnummer.strip(), [])
+            lo = bisect_left(keys, (date_from,)) if date_from else 0
+            hi = bisect_left(keys, (date_to, "\uffff")) if date_to else len(keys)
+            total = max(0, hi - lo)
+            if after is not None:
+                if descending:
+                    hi = min(hi, bisect_left(keys, after))
+                else:
+                    lo = max(lo, bisect_right(keys, after))
+            if descending:
+                page = keys[max(lo, hi - limit):hi][::-1]
+            else:
+                page = keys[lo:min(hi, lo + limit)]
+            more = hi - lo > limit
+            return [self._as_dict(k[2]) for k in page], total, (page[-1] if more else None)
+
+    def rows(self) -> list[dict]:
+        with self._lock:
+            self.refresh()
+            return [self._as_dict(i) for i in range(len(self._rows))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.refresh()
+            return len(self._rows)
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread for samples.csv.
+    Rows are queued by request threads and written in batches: a batch closes when it
+    reaches `batch_size` rows or `batch_wait` seconds after its first row arrived.
+    Every caller gets a Future that resolves after write + flush (+ fsync).
+    """
+
+    def __init__(self, store: SampleStore, *, batch_size: int, batch_wait: float, fsync: bool):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0.0, batch_wait)
+        self.fsync = fsync
+        self._queue: "queue.Queue[tuple[list[str], Future] | None]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._fh: Optional[io.TextIOWrapper] = None
+
+    def submit(self, row: list[str]) -> Future:
+        fut: Future = Future()
+        self._ensure_started()
+        self._queue.put((row, fut))
+        return fut
+
+    def close(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="samples-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stopping = True
+                    break
+                batch.append(nxt)
+            self._flush(batch)
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _open(self) -> io.TextIOWrapper:
+        # Reopen if the file was replaced underneath us (e.g. --migrate)
+        if self._fh is not None:
+            try:
+                if os.stat(self.store.csv_path).st_ino == os.fstat(self._fh.fileno()).st_ino:
+                    return self._fh
+            except FileNotFoundError:
+                pass
+            self._fh.close()
+        self.store.ensure()
+        self._fh = self.store.csv_path.open("a", newline="", encoding="utf-8")
+        return self._fh
+
+    def _flush(self, batch: list[tuple[list[str], Future]]) -> None:
+        try:
+            with self.store.file_lock:  # O_APPEND alone doesn't keep a buffered batch in one piece
+                fh = self._open()
+                csv.writer(fh).writerows(row for row, _ in batch)
+                fh.flush()
+                if self.fsync:
+                    os.fsync(fh.fileno())
+            self.store.refresh()
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for _, fut in batch:
+            fut.set_result(None)
+
+
+def migrate_legacy_header(csv_path: Path) -> bool:
+    """
+    Rewrite a samples.csv that still uses `dato,klokke` so it uses the current header.
+    Data rows are copied unchanged. Returns True if the file was rewritten.
+    """
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        return False
+    with FileLock(csv_path.with_name(csv_path.name + LOCK_SUFFIX)):  # no appends while copying
+        with csv_path.open("r", newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f), None)
+            if not header or normalise_header(header) == [h.strip().lower() for h in header]:
+                return False
+            tmp = csv_path.with_suffix(csv_path.suffix + ".tmp")
+            with tmp.open("w", newline="", encoding="utf-8") as out:
+                csv.writer(out).writerow(normalise_header(header))
+                for line in f:
+                    out.write(line)
+        os.replace(tmp, csv_path)
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--migrate":
+        target = Path(sys.argv[2]) if len(sys.argv) >= 3 else Path(__file__).with_name("samples.csv")
+        if migrate_legacy_header(target):
+            print(f"✓ Migrated header → {','.join(FIELDNAMES)} in {target}")
+        else:
+            print(f"Nothing to migrate in {target}")
+    else:
+        print(__doc__)
@@ -0,0 +1,128 @@
+# backEnd/DigLabAPI/PythonService/warmup.py
+"""
+Warm-up and startup timing.
+
+main.py only imports what /health, /metrics, /register and /lookup need; PyMuPDF,
+NumPy, PIL, qrcode and ReportLab are imported by the routes that use them. warm_up()
+loads them before the first request by running the real code paths once:
+
+  forms     render one requisition: ReportLab stylesheet + fonts, the cached form
+            template, PyMuPDF font metrics, qrcode
+  analysis  analyse a one-page PDF: text extraction, the PyMuPDF renderer, NumPy
+            scoring, the QR detector
+  images    PIL's image plugins and image_analysis (raster scans)
+
+main.py runs it (DIGLAB_WARMUP, default all steps) in a background thread once the
+service reports ready, before that with DIGLAB_WARMUP_SYNC=1, or, with
+DIGLAB_PRELOAD=1, while it is imported, so a pre-forking server
+(gunicorn --preload -k uvicorn.workers.UvicornWorker main:app) pays once for all of
+its workers. Pool workers run their steps as the process initializer (warm_worker).
+
+The startup report (STARTUP; /health "startup", /metrics diglab_startup_seconds)
+records how long after process start main.py was imported and the service was
+ready, the time per warm-up step, and which heavy libraries were loaded by then.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+from typing import Callable, Iterable, Optional
+
+from metrics import collect
+
+HEAVY_MODULES = ("fitz", "numpy", "PIL", "qrcode", "reportlab", "cv2")
+
+STARTUP: dict = {"warmup": {}}
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started (Linux /proc; None elsewhere)."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            start_ticks = int(f.read().rsplit(b")", 1)[1].split()[19])
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 3)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def heavy_modules() -> list[str]:
+    return [m for m in HEAVY_MODULES if m in sys.modules]
+
+
+def mark(phase: str) -> None:
+    """Record the process age at `phase` ("imported", "ready") and the libraries loaded so far."""
+    STARTUP[phase] = process_age()
+    STARTUP[f"{phase}Modules"] = heavy_modules()
+
+
+# ------------------------------------------------------------------ steps
+def warm_forms() -> None:
+    from form_qr import encode_payload
+    from form_template import render_lab_forms
+    from pdf_analysis import DIAGNOSES
+
+    lab = "LAB-20000101-00000000"
+    render_lab_forms([{
+        "labnummer": lab, "name": "Warm-up", "date": "2000-01-01", "time": "00:00",
+        "diagnoses": DIAGNOSES[:1], "personnummer": None, "qr": encode_payload(lab, DIAGNOSES[:1], DIAGNOSES),
+    }])
+
+
+def warm_analysis() -> None:
+    import fitz  # PyMuPDF
+
+    from pdf_analysis import analyze_pdf, dark_fractions
+
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), "Dengue [ ] [ ] [ ]", fontname="helv")
+        pdf = doc.tobytes()
+    analyze_pdf(pdf)
+    with fitz.open("pdf", pdf) as doc:
+        dark_fractions(doc[0], [fitz.Rect(72, 60, 160, 80)])
+
+
+def warm_images() -> None:
+    from PIL import Image
+
+    import image_analysis  # noqa: F401
+
+    Image.init()  # registers every plugin (otherwise done on the first unknown format)
+
+
+STEPS: dict[str, Callable[[], None]] = {"forms": warm_forms, "analysis": warm_analysis, "images": warm_images}
+
+
+def parse_steps(value: str) -> tuple[str, ...]:
+    """DIGLAB_WARMUP-style list: "forms,analysis", "1"/"all" = every step, "0"/"" = none."""
+    value = value.strip().lower()
+    if value in ("", "0", "none", "off"):
+        return ()
+    if value in ("1", "all", "on"):
+        return tuple(STEPS)
+    steps = tuple(s.strip() for s in value.split(",") if s.strip())
+    unknown = [s for s in steps if s not in STEPS]
+    if unknown:
+        raise ValueError(f"unknown warm-up steps {unknown}; choose from {list(STEPS)}")
+    return steps
+
+
+def warm_up(steps: Iterable[str]) -> dict[str, float]:
+    """Run the steps in order -> seconds per step (also added to STARTUP["warmup"])."""
+    done: dict[str, float] = {}
+    for name in steps:
+        t0 = time.perf_counter()
+        collect(STEPS[name])  # stage timings of the warm-up run are dropped, not observed
+        done[name] = round(time.perf_counter() - t0, 4)
+    STARTUP["warmup"].update(done)
+    return done
+
+
+def warm_worker(steps: tuple[str, ...]) -> None:
+    """ProcessPoolExecutor initializer: a failed warm-up must not break the pool."""
+    try:
+        warm_up(steps)
+    except Exception:
+        pass